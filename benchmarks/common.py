@@ -0,0 +1,193 @@
+"""Helpers shared by the benchmarks: a throwaway server process, seeding and byte counting"""
+import abc
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import grpc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import books_pb2
+import books_pb2_grpc
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds"""
+    return {
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+    }
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Process exited with code {process.returncode} before listening on {port}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'Nothing listened on port {port} within {timeout} seconds')
+
+
+class _Process(abc.ABC):
+    """Runs a command on a free port with a temporary database until the context exits"""
+
+    def __init__(self, env=None, db_path=None):
+        self.port = free_port()
+        self._tmpdir = None
+        if db_path is None:
+            self._tmpdir = tempfile.TemporaryDirectory()
+            db_path = os.path.join(self._tmpdir.name, 'books.db')
+        self.db_path = db_path
+        self.env = dict(os.environ, DB_PATH=db_path, PYTHONUNBUFFERED='1')
+        self.env.update(env or {})
+        self._process = None
+
+    @property
+    def address(self):
+        return f'127.0.0.1:{self.port}'
+
+    @abc.abstractmethod
+    def command(self):
+        """Returns the argv to run, after adjusting self.env if needed"""
+
+    def __enter__(self):
+        self._process = subprocess.Popen(
+            self.command(),
+            cwd=ROOT,
+            env=self.env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        wait_for_port(self.port, self._process)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+
+
+class ServerProcess(_Process):
+    """Runs server/server.py against its own book database"""
+
+    def command(self):
+        self.env['GRPC_PORT'] = str(self.port)
+        return [sys.executable, os.path.join(ROOT, 'server', 'server.py')]
+
+
+class GatewayProcess(_Process):
+    """Runs the FastAPI gateway in front of a server, with its own user database"""
+
+    def __init__(self, server, env=None):
+        super().__init__(env=env)
+        self.env['GRPC_HOST'] = '127.0.0.1'
+        self.env['GRPC_PORT'] = str(server.port)
+
+    def command(self):
+        return [sys.executable, '-m', 'uvicorn', 'client.main:app',
+                '--host', '127.0.0.1', '--port', str(self.port), '--log-level', 'warning']
+
+
+def seed_books(address, count, batch=1000):
+    """Imports count generated books through import_books"""
+    def requests():
+        for i in range(count):
+            yield books_pb2.AddBookRequest(
+                title=f'Benchmark book {i} about {("distributed", "embedded", "functional")[i % 3]} systems',
+                author=f'Author {i % 500}',
+                year=1900 + i % 125
+            )
+
+    with grpc.insecure_channel(address) as channel:
+        return books_pb2_grpc.BookServiceStub(channel).import_books(requests(), timeout=600)
+
+
+class ByteCountingProxy:
+    """TCP proxy in front of the server that counts the bytes flowing in each direction"""
+
+    def __init__(self, target_port):
+        self.target_port = target_port
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self._lock = threading.Lock()
+        self._listener = socket.socket()
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen()
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    @property
+    def address(self):
+        return f'127.0.0.1:{self.port}'
+
+    def reset(self):
+        with self._lock:
+            self.bytes_up = 0
+            self.bytes_down = 0
+
+    def close(self):
+        self._listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            for src, dst, field in ((client, upstream, 'bytes_up'), (upstream, client, 'bytes_down')):
+                threading.Thread(target=self._pipe, args=(src, dst, field), daemon=True).start()
+
+    def _pipe(self, src, dst, field):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                with self._lock:
+                    setattr(self, field, getattr(self, field) + len(data))
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (src, dst):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
@@ -0,0 +1,79 @@
+"""Compares bytes on the wire and latency of list_books and stream_books per compression mode.
+
+stream_books sends one Book per message, below any useful --min-bytes, so it serves as the
+uncompressed baseline.
+
+Usage: python -m benchmarks.compression [--books 20000] [--iterations 50] [--page-size 500]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import grpc
+
+from .common import ByteCountingProxy, ServerProcess, books_pb2, books_pb2_grpc, seed_books, summarize, timed
+
+MODES = ('none', 'gzip', 'deflate')
+
+
+def run_mode(mode, db_path, args):
+    env = {'GRPC_COMPRESSION': mode, 'GRPC_COMPRESSION_MIN_BYTES': str(args.min_bytes)}
+    with ServerProcess(env=env, db_path=db_path) as server:
+        proxy = ByteCountingProxy(server.port)
+        options = [('grpc.max_receive_message_length', 64 * 1024 * 1024)]
+        with grpc.insecure_channel(proxy.address, options=options) as channel:
+            stub = books_pb2_grpc.BookServiceStub(channel)
+            request = books_pb2.ListBooksRequest(page_size=args.page_size)
+            stub.list_books(request)  # warm up the connection and the page cache
+
+            proxy.reset()
+            list_samples = [timed(stub.list_books, request)[0] for _ in range(args.iterations)]
+            list_bytes = proxy.bytes_down
+
+            proxy.reset()
+            stream_samples = []
+            for _ in range(max(1, args.iterations // 10)):
+                stream_samples.append(timed(lambda: sum(1 for _ in stub.stream_books(books_pb2.StreamBooksRequest())))[0])
+            stream_bytes = proxy.bytes_down
+        proxy.close()
+
+    return {
+        'list_books': dict(summarize(list_samples), bytes_per_call=list_bytes / len(list_samples)),
+        'stream_books': dict(summarize(stream_samples), bytes_per_call=stream_bytes / len(stream_samples)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--min-bytes', type=int, default=1024)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmpdir, 'books.db')
+        with ServerProcess(db_path=db_path) as server:
+            seed_books(server.address, args.books)
+
+        results = {mode: run_mode(mode, db_path, args) for mode in MODES}
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print(f"{'mode':<8} {'rpc':<13} {'bytes/call':>12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for mode, rpcs in results.items():
+        for rpc, row in rpcs.items():
+            print(f"{mode:<8} {rpc:<13} {row['bytes_per_call']:>12.0f} "
+                  f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
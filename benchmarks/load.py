@@ -0,0 +1,240 @@
+"""Drives get_book, list_books and add_book at a fixed concurrency, over gRPC and through the gateway.
+
+Usage: python -m benchmarks.load [--books 10000] [--requests 2000] [--concurrency 16]
+                                 [--targets grpc,gateway] [--ops get_book,list_books,add_book] [--channels 1]
+                                 [--env KEY=VALUE ...] [--output results.json] [--baseline old.json]
+
+Each run seeds a fresh server, so results only depend on the arguments and the code under
+test. The JSON output holds the arguments, the git commit and, per target and operation,
+the throughput and latency percentiles; --baseline prints the change against an earlier run.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+
+import grpc
+
+from .common import ROOT, GatewayProcess, ServerProcess, books_pb2, books_pb2_grpc, seed_books, summarize
+
+TARGETS = ('grpc', 'gateway')
+OPERATIONS = ('get_book', 'list_books', 'add_book')
+AUTHORS = 500  # distinct authors created by seed_books
+LIST_PAGE_SIZE = 100
+
+
+class GrpcTarget:
+    def __init__(self, server, args):
+        # Separate subchannel pools give every channel its own connection, so that
+        # GRPC_PROCESSES workers behind SO_REUSEPORT all receive traffic
+        self.channels = [
+            grpc.insecure_channel(server.address, options=[('grpc.use_local_subchannel_pool', 1)])
+            for _ in range(args.channels)
+        ]
+        self.stubs = [books_pb2_grpc.BookServiceStub(channel) for channel in self.channels]
+        self.books = args.books
+        self._sessions = itertools.count()
+
+    def session(self):
+        return self.stubs[next(self._sessions) % len(self.stubs)]
+
+    def get_book(self, stub, rng):
+        stub.get_book(books_pb2.BookRequest(id=rng.randint(1, self.books)))
+
+    def list_books(self, stub, rng):
+        stub.list_books(books_pb2.ListBooksRequest(page_size=LIST_PAGE_SIZE, author=f'Author {rng.randrange(AUTHORS)}'))
+
+    def add_book(self, stub, rng):
+        stub.add_book(books_pb2.AddBookRequest(title=f'Load book {rng.random()}', author='Load', year=2000))
+
+    def close(self):
+        for channel in self.channels:
+            channel.close()
+
+
+class GatewayTarget:
+    def __init__(self, gateway, args):
+        self.port = gateway.port
+        self.books = args.books
+        self.token = self._login()
+
+    def _request(self, conn, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if body is not None and 'Content-Type' not in headers:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        content = response.read()
+        if response.status >= 400:
+            raise RuntimeError(f'{method} {path} returned {response.status}: {content[:200]!r}')
+        return content
+
+    def _login(self):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        self._request(conn, 'POST', '/register', {'username': 'bench', 'email': 'bench@example.com', 'password': 'bench'})
+        form = urllib.parse.urlencode({'username': 'bench', 'password': 'bench'})
+        content = self._request(conn, 'POST', '/login', form, {'Content-Type': 'application/x-www-form-urlencoded'})
+        conn.close()
+        return json.loads(content)['access_token']
+
+    def session(self):
+        # One keep-alive connection per worker, like a pooled HTTP client
+        return http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+
+    def get_book(self, conn, rng):
+        self._request(conn, 'GET', f'/books/{rng.randint(1, self.books)}', headers=self._auth())
+
+    def list_books(self, conn, rng):
+        query = urllib.parse.urlencode({'page_size': LIST_PAGE_SIZE, 'author': f'Author {rng.randrange(AUTHORS)}'})
+        self._request(conn, 'GET', f'/books?{query}', headers=self._auth())
+
+    def add_book(self, conn, rng):
+        self._request(conn, 'POST', '/books', {'title': f'Load book {rng.random()}', 'author': 'Load', 'year': 2000},
+                      self._auth())
+
+    def _auth(self):
+        return {'Authorization': f'Bearer {self.token}'}
+
+    def close(self):
+        pass
+
+
+def run_operation(target, operation, args):
+    """Runs args.requests calls of one operation from args.concurrency threads"""
+    call = getattr(target, operation)
+    remaining = [args.requests]
+    lock = threading.Lock()
+    samples = []
+    errors = []
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        session = target.session()
+        local = []
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                call(session, rng)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                if isinstance(session, http.client.HTTPConnection):
+                    session.close()
+                continue
+            local.append(time.perf_counter() - start)
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'requests': args.requests,
+        'errors': len(errors),
+        'seconds': elapsed,
+        'throughput_rps': len(samples) / elapsed if elapsed else 0.0,
+        'mean_ms': sum(samples) / len(samples) * 1000 if samples else 0.0,
+    }
+    result.update(summarize(samples))
+    if errors:
+        result['first_error'] = errors[0]
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    print(f"{'target':<8} {'operation':<11} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for target, operations in results.items():
+        for operation, row in operations.items():
+            line = (f"{target:<8} {operation:<11} {row['throughput_rps']:>9.1f} {row['p50_ms']:>8.2f} "
+                    f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['errors']:>7}")
+            old = (baseline or {}).get(target, {}).get(operation)
+            if old and old['throughput_rps'] and old['p99_ms']:
+                rps_change = (row['throughput_rps'] / old['throughput_rps'] - 1) * 100
+                p99_change = (row['p99_ms'] / old['p99_ms'] - 1) * 100
+                line += f"   rps {rps_change:+.1f}%  p99 {p99_change:+.1f}%"
+            print(line)
+
+
+def parse_list(value, allowed):
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = set(items) - set(allowed)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown: {', '.join(sorted(unknown))}; expected {', '.join(allowed)}")
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=10000, help='books to seed before the run')
+    parser.add_argument('--requests', type=int, default=2000, help='calls per target and operation')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--channels', type=int, default=1, help='gRPC channels (connections) shared by the workers')
+    parser.add_argument('--targets', type=lambda v: parse_list(v, TARGETS), default=list(TARGETS))
+    parser.add_argument('--ops', type=lambda v: parse_list(v, OPERATIONS), default=list(OPERATIONS))
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the server and the gateway, e.g. GRPC_SERVER_MODE=aio')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON from an earlier run to compare against')
+    args = parser.parse_args()
+
+    env = dict(item.split('=', 1) for item in args.env)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    with ServerProcess(env=env) as server:
+        seed_books(server.address, args.books)
+        for target_name in args.targets:
+            if target_name == 'grpc':
+                target = GrpcTarget(server, args)
+                results['grpc'] = {op: run_operation(target, op, args) for op in args.ops}
+                target.close()
+            else:
+                with GatewayProcess(server, env=env) as gateway:
+                    target = GatewayTarget(gateway, args)
+                    results['gateway'] = {op: run_operation(target, op, args) for op in args.ops}
+
+    print_results(results, baseline)
+
+    if args.output:
+        report = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'arguments': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
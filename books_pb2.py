@@ -11,29 +11,50 @@ from google.protobuf.internal import builder as _builder
 _sym_db = _symbol_database.Default()
 
 
+from google.protobuf import field_mask_pb2 as google_dot_protobuf_dot_field__mask__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0b\x62ooks.proto\x12\x05\x62ooks\"?\n\x04\x42ook\x12\n\n\x02id\x18\x01 \x01(\x05\x12\r\n\x05title\x18\x02 \x01(\t\x12\x0e\n\x06\x61uthor\x18\x03 \x01(\t\x12\x0c\n\x04year\x18\x04 \x01(\x05\"\x19\n\x0b\x42ookRequest\x12\n\n\x02id\x18\x01 \x01(\x05\")\n\x0c\x42ookResponse\x12\x19\n\x04\x62ook\x18\x01 \x01(\x0b\x32\x0b.books.Book\"\x12\n\x10ListBooksRequest\"/\n\x11ListBooksResponse\x12\x1a\n\x05\x62ooks\x18\x01 \x03(\x0b\x32\x0b.books.Book\"=\n\x0e\x41\x64\x64\x42ookRequest\x12\r\n\x05title\x18\x01 \x01(\t\x12\x0e\n\x06\x61uthor\x18\x02 \x01(\t\x12\x0c\n\x04year\x18\x03 \x01(\x05\"6\n\x12\x44\x65leteBookResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t2\x81\x02\n\x0b\x42ookService\x12\x35\n\x08get_book\x12\x12.books.BookRequest\x1a\x13.books.BookResponse\"\x00\x12\x41\n\nlist_books\x12\x17.books.ListBooksRequest\x1a\x18.books.ListBooksResponse\"\x00\x12\x38\n\x08\x61\x64\x64_book\x12\x15.books.AddBookRequest\x1a\x13.books.BookResponse\"\x00\x12>\n\x0b\x64\x65lete_book\x12\x12.books.BookRequest\x1a\x19.books.DeleteBookResponse\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0b\x62ooks.proto\x12\x05\x62ooks\x1a google/protobuf/field_mask.proto\"?\n\x04\x42ook\x12\n\n\x02id\x18\x01 \x01(\x05\x12\r\n\x05title\x18\x02 \x01(\t\x12\x0e\n\x06\x61uthor\x18\x03 \x01(\t\x12\x0c\n\x04year\x18\x04 \x01(\x05\"H\n\x0b\x42ookRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12-\n\tread_mask\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.FieldMask\")\n\x0c\x42ookResponse\x12\x19\n\x04\x62ook\x18\x01 \x01(\x0b\x32\x0b.books.Book\"#\n\x14\x42\x61tchGetBooksRequest\x12\x0b\n\x03ids\x18\x01 \x03(\x05\"H\n\x15\x42\x61tchGetBooksResponse\x12\x1a\n\x05\x62ooks\x18\x01 \x03(\x0b\x32\x0b.books.Book\x12\x13\n\x0bmissing_ids\x18\x02 \x03(\x05\"\xc0\x01\n\x10ListBooksRequest\x12\x11\n\tpage_size\x18\x01 \x01(\x05\x12\x12\n\npage_token\x18\x02 \x01(\t\x12\x0e\n\x06\x61uthor\x18\x03 \x01(\t\x12\x15\n\x08min_year\x18\x04 \x01(\x05H\x00\x88\x01\x01\x12\x15\n\x08max_year\x18\x05 \x01(\x05H\x01\x88\x01\x01\x12-\n\tread_mask\x18\x06 \x01(\x0b\x32\x1a.google.protobuf.FieldMaskB\x0b\n\t_min_yearB\x0b\n\t_max_year\"H\n\x11ListBooksResponse\x12\x1a\n\x05\x62ooks\x18\x01 \x03(\x0b\x32\x0b.books.Book\x12\x17\n\x0fnext_page_token\x18\x02 \x01(\t\"(\n\x12StreamBooksRequest\x12\x12\n\nchunk_size\x18\x01 \x01(\x05\"2\n\x12SearchBooksRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\r\n\x05limit\x18\x02 \x01(\x05\"1\n\x13SearchBooksResponse\x12\x1a\n\x05\x62ooks\x18\x01 \x03(\x0b\x32\x0b.books.Book\"=\n\x0e\x41\x64\x64\x42ookRequest\x12\r\n\x05title\x18\x01 \x01(\t\x12\x0e\n\x06\x61uthor\x18\x02 \x01(\t\x12\x0c\n\x04year\x18\x03 \x01(\x05\",\n\x07IdRange\x12\x10\n\x08\x66irst_id\x18\x01 \x01(\x05\x12\x0f\n\x07last_id\x18\x02 \x01(\x05\"P\n\x13ImportBooksResponse\x12\x16\n\x0eimported_count\x18\x01 \x01(\x05\x12!\n\tid_ranges\x18\x02 \x03(\x0b\x32\x0e.books.IdRange\"6\n\x12\x44\x65leteBookResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\")\n\x11WatchBooksRequest\x12\x14\n\x0c\x66rom_version\x18\x01 \x01(\x03\"\xae\x01\n\tBookEvent\x12\x0f\n\x07version\x18\x01 \x01(\x03\x12#\n\x04type\x18\x02 \x01(\x0e\x32\x15.books.BookEvent.Type\x12\x0f\n\x07\x62ook_id\x18\x03 \x01(\x05\x12\x19\n\x04\x62ook\x18\x04 \x01(\x0b\x32\x0b.books.Book\"?\n\x04Type\x12\x14\n\x10TYPE_UNSPECIFIED\x10\x00\x12\t\n\x05\x41\x44\x44\x45\x44\x10\x01\x12\x0b\n\x07\x44\x45LETED\x10\x02\x12\t\n\x05RESET\x10\x03\x32\xdc\x04\n\x0b\x42ookService\x12\x35\n\x08get_book\x12\x12.books.BookRequest\x1a\x13.books.BookResponse\"\x00\x12N\n\x0f\x62\x61tch_get_books\x12\x1b.books.BatchGetBooksRequest\x1a\x1c.books.BatchGetBooksResponse\"\x00\x12\x41\n\nlist_books\x12\x17.books.ListBooksRequest\x1a\x18.books.ListBooksResponse\"\x00\x12G\n\x0csearch_books\x12\x19.books.SearchBooksRequest\x1a\x1a.books.SearchBooksResponse\"\x00\x12\x38\n\x08\x61\x64\x64_book\x12\x15.books.AddBookRequest\x1a\x13.books.BookResponse\"\x00\x12\x45\n\x0cimport_books\x12\x15.books.AddBookRequest\x1a\x1a.books.ImportBooksResponse\"\x00(\x01\x12>\n\x0b\x64\x65lete_book\x12\x12.books.BookRequest\x1a\x19.books.DeleteBookResponse\"\x00\x12:\n\x0cstream_books\x12\x19.books.StreamBooksRequest\x1a\x0b.books.Book\"\x00\x30\x01\x12=\n\x0bwatch_books\x12\x18.books.WatchBooksRequest\x1a\x10.books.BookEvent\"\x00\x30\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'books_pb2', _globals)
 if _descriptor._USE_C_DESCRIPTORS == False:
   DESCRIPTOR._options = None
-  _globals['_BOOK']._serialized_start=22
-  _globals['_BOOK']._serialized_end=85
-  _globals['_BOOKREQUEST']._serialized_start=87
-  _globals['_BOOKREQUEST']._serialized_end=112
-  _globals['_BOOKRESPONSE']._serialized_start=114
-  _globals['_BOOKRESPONSE']._serialized_end=155
-  _globals['_LISTBOOKSREQUEST']._serialized_start=157
-  _globals['_LISTBOOKSREQUEST']._serialized_end=175
-  _globals['_LISTBOOKSRESPONSE']._serialized_start=177
-  _globals['_LISTBOOKSRESPONSE']._serialized_end=224
-  _globals['_ADDBOOKREQUEST']._serialized_start=226
-  _globals['_ADDBOOKREQUEST']._serialized_end=287
-  _globals['_DELETEBOOKRESPONSE']._serialized_start=289
-  _globals['_DELETEBOOKRESPONSE']._serialized_end=343
-  _globals['_BOOKSERVICE']._serialized_start=346
-  _globals['_BOOKSERVICE']._serialized_end=603
+  _globals['_BOOK']._serialized_start=56
+  _globals['_BOOK']._serialized_end=119
+  _globals['_BOOKREQUEST']._serialized_start=121
+  _globals['_BOOKREQUEST']._serialized_end=193
+  _globals['_BOOKRESPONSE']._serialized_start=195
+  _globals['_BOOKRESPONSE']._serialized_end=236
+  _globals['_BATCHGETBOOKSREQUEST']._serialized_start=238
+  _globals['_BATCHGETBOOKSREQUEST']._serialized_end=273
+  _globals['_BATCHGETBOOKSRESPONSE']._serialized_start=275
+  _globals['_BATCHGETBOOKSRESPONSE']._serialized_end=347
+  _globals['_LISTBOOKSREQUEST']._serialized_start=350
+  _globals['_LISTBOOKSREQUEST']._serialized_end=542
+  _globals['_LISTBOOKSRESPONSE']._serialized_start=544
+  _globals['_LISTBOOKSRESPONSE']._serialized_end=616
+  _globals['_STREAMBOOKSREQUEST']._serialized_start=618
+  _globals['_STREAMBOOKSREQUEST']._serialized_end=658
+  _globals['_SEARCHBOOKSREQUEST']._serialized_start=660
+  _globals['_SEARCHBOOKSREQUEST']._serialized_end=710
+  _globals['_SEARCHBOOKSRESPONSE']._serialized_start=712
+  _globals['_SEARCHBOOKSRESPONSE']._serialized_end=761
+  _globals['_ADDBOOKREQUEST']._serialized_start=763
+  _globals['_ADDBOOKREQUEST']._serialized_end=824
+  _globals['_IDRANGE']._serialized_start=826
+  _globals['_IDRANGE']._serialized_end=870
+  _globals['_IMPORTBOOKSRESPONSE']._serialized_start=872
+  _globals['_IMPORTBOOKSRESPONSE']._serialized_end=952
+  _globals['_DELETEBOOKRESPONSE']._serialized_start=954
+  _globals['_DELETEBOOKRESPONSE']._serialized_end=1008
+  _globals['_WATCHBOOKSREQUEST']._serialized_start=1010
+  _globals['_WATCHBOOKSREQUEST']._serialized_end=1051
+  _globals['_BOOKEVENT']._serialized_start=1054
+  _globals['_BOOKEVENT']._serialized_end=1228
+  _globals['_BOOKEVENT_TYPE']._serialized_start=1165
+  _globals['_BOOKEVENT_TYPE']._serialized_end=1228
+  _globals['_BOOKSERVICE']._serialized_start=1231
+  _globals['_BOOKSERVICE']._serialized_end=1835
 # @@protoc_insertion_point(module_scope)
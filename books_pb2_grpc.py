@@ -20,21 +20,46 @@ class BookServiceStub(object):
                 request_serializer=books__pb2.BookRequest.SerializeToString,
                 response_deserializer=books__pb2.BookResponse.FromString,
                 )
+        self.batch_get_books = channel.unary_unary(
+                '/books.BookService/batch_get_books',
+                request_serializer=books__pb2.BatchGetBooksRequest.SerializeToString,
+                response_deserializer=books__pb2.BatchGetBooksResponse.FromString,
+                )
         self.list_books = channel.unary_unary(
                 '/books.BookService/list_books',
                 request_serializer=books__pb2.ListBooksRequest.SerializeToString,
                 response_deserializer=books__pb2.ListBooksResponse.FromString,
                 )
+        self.search_books = channel.unary_unary(
+                '/books.BookService/search_books',
+                request_serializer=books__pb2.SearchBooksRequest.SerializeToString,
+                response_deserializer=books__pb2.SearchBooksResponse.FromString,
+                )
         self.add_book = channel.unary_unary(
                 '/books.BookService/add_book',
                 request_serializer=books__pb2.AddBookRequest.SerializeToString,
                 response_deserializer=books__pb2.BookResponse.FromString,
                 )
+        self.import_books = channel.stream_unary(
+                '/books.BookService/import_books',
+                request_serializer=books__pb2.AddBookRequest.SerializeToString,
+                response_deserializer=books__pb2.ImportBooksResponse.FromString,
+                )
         self.delete_book = channel.unary_unary(
                 '/books.BookService/delete_book',
                 request_serializer=books__pb2.BookRequest.SerializeToString,
                 response_deserializer=books__pb2.DeleteBookResponse.FromString,
                 )
+        self.stream_books = channel.unary_stream(
+                '/books.BookService/stream_books',
+                request_serializer=books__pb2.StreamBooksRequest.SerializeToString,
+                response_deserializer=books__pb2.Book.FromString,
+                )
+        self.watch_books = channel.unary_stream(
+                '/books.BookService/watch_books',
+                request_serializer=books__pb2.WatchBooksRequest.SerializeToString,
+                response_deserializer=books__pb2.BookEvent.FromString,
+                )
 
 
 class BookServiceServicer(object):
@@ -48,8 +73,22 @@ class BookServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def batch_get_books(self, request, context):
+        """Get several books by ID in one call
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def list_books(self, request, context):
-        """List all books
+        """List books page by page, optionally filtered
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def search_books(self, request, context):
+        """Full-text search over titles and authors
         """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
@@ -62,6 +101,13 @@ class BookServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def import_books(self, request_iterator, context):
+        """Import a stream of books in bulk
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def delete_book(self, request, context):
         """Delete a book
         """
@@ -69,6 +115,20 @@ class BookServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def stream_books(self, request, context):
+        """Stream all books, one message per book
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def watch_books(self, request, context):
+        """Stream book changes as they happen, resuming after a version already seen
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_BookServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -77,21 +137,46 @@ def add_BookServiceServicer_to_server(servicer, server):
                     request_deserializer=books__pb2.BookRequest.FromString,
                     response_serializer=books__pb2.BookResponse.SerializeToString,
             ),
+            'batch_get_books': grpc.unary_unary_rpc_method_handler(
+                    servicer.batch_get_books,
+                    request_deserializer=books__pb2.BatchGetBooksRequest.FromString,
+                    response_serializer=books__pb2.BatchGetBooksResponse.SerializeToString,
+            ),
             'list_books': grpc.unary_unary_rpc_method_handler(
                     servicer.list_books,
                     request_deserializer=books__pb2.ListBooksRequest.FromString,
                     response_serializer=books__pb2.ListBooksResponse.SerializeToString,
             ),
+            'search_books': grpc.unary_unary_rpc_method_handler(
+                    servicer.search_books,
+                    request_deserializer=books__pb2.SearchBooksRequest.FromString,
+                    response_serializer=books__pb2.SearchBooksResponse.SerializeToString,
+            ),
             'add_book': grpc.unary_unary_rpc_method_handler(
                     servicer.add_book,
                     request_deserializer=books__pb2.AddBookRequest.FromString,
                     response_serializer=books__pb2.BookResponse.SerializeToString,
             ),
+            'import_books': grpc.stream_unary_rpc_method_handler(
+                    servicer.import_books,
+                    request_deserializer=books__pb2.AddBookRequest.FromString,
+                    response_serializer=books__pb2.ImportBooksResponse.SerializeToString,
+            ),
             'delete_book': grpc.unary_unary_rpc_method_handler(
                     servicer.delete_book,
                     request_deserializer=books__pb2.BookRequest.FromString,
                     response_serializer=books__pb2.DeleteBookResponse.SerializeToString,
             ),
+            'stream_books': grpc.unary_stream_rpc_method_handler(
+                    servicer.stream_books,
+                    request_deserializer=books__pb2.StreamBooksRequest.FromString,
+                    response_serializer=books__pb2.Book.SerializeToString,
+            ),
+            'watch_books': grpc.unary_stream_rpc_method_handler(
+                    servicer.watch_books,
+                    request_deserializer=books__pb2.WatchBooksRequest.FromString,
+                    response_serializer=books__pb2.BookEvent.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'books.BookService', rpc_method_handlers)
@@ -120,6 +205,23 @@ class BookService(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def batch_get_books(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/books.BookService/batch_get_books',
+            books__pb2.BatchGetBooksRequest.SerializeToString,
+            books__pb2.BatchGetBooksResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def list_books(request,
             target,
@@ -137,6 +239,23 @@ class BookService(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def search_books(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/books.BookService/search_books',
+            books__pb2.SearchBooksRequest.SerializeToString,
+            books__pb2.SearchBooksResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def add_book(request,
             target,
@@ -154,6 +273,23 @@ class BookService(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def import_books(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(request_iterator, target, '/books.BookService/import_books',
+            books__pb2.AddBookRequest.SerializeToString,
+            books__pb2.ImportBooksResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def delete_book(request,
             target,
@@ -170,3 +306,37 @@ class BookService(object):
             books__pb2.DeleteBookResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def stream_books(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/books.BookService/stream_books',
+            books__pb2.StreamBooksRequest.SerializeToString,
+            books__pb2.Book.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def watch_books(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/books.BookService/watch_books',
+            books__pb2.WatchBooksRequest.SerializeToString,
+            books__pb2.BookEvent.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -6,26 +6,27 @@ from typing import Optional
 from .models import TokenData, User, UserInDB
 from .utils import verify_password
 from ..config import JWT_SECRET_KEY, JWT_ALGORITHM
+from ..services.password_hasher import password_hasher
 from ..services.user_service import user_service
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
-def get_user(username: str) -> Optional[UserInDB]:
+async def get_user(username: str) -> Optional[UserInDB]:
     """Get a user by username"""
-    user_dict = user_service.get_by_username(username)
+    user_dict = await user_service.get_by_username_async(username)
     if user_dict:
         return UserInDB(**user_dict)
     return None
 
 
-def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
-    """Authenticate a user"""
-    user = get_user(username)
+async def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
+    """Authenticate a user, checking the password off the event loop"""
+    user = await get_user(username)
     if not user:
         return None
-    if not user_service.verify_password(password, user.hashed_password):
+    if not await password_hasher.verify(password, user.hashed_password):
         return None
     return user
 
@@ -45,7 +46,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user(username=token_data.username)
+    user = await get_user(username=token_data.username)
     if user is None:
         raise credentials_exception
     return user
@@ -6,32 +6,51 @@ from .models import User, UserCreate, Token
 from .utils import create_access_token
 from .dependencies import authenticate_user, get_current_active_user
 from ..config import JWT_ACCESS_TOKEN_EXPIRE_MINUTES
-from ..services.user_service import user_service
+from ..services.password_hasher import password_hasher, PasswordHasherBusy
+from ..services.user_service import user_service, UserAlreadyExists
 
 
 router = APIRouter(tags=["Authentication"])
 
 
+def password_hasher_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, try again later",
+        headers={"Retry-After": "1"},
+    )
+
+
+def user_already_exists_exception(e: UserAlreadyExists) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=str(e)
+    )
+
+
 @router.post("/register", response_model=User)
 async def register_user(user_data: UserCreate):
+    # Cheap checks first, so that a taken username or email never costs a bcrypt slot;
+    # register() checks again in its transaction for registrations that race this one
+    if await user_service.get_by_username_async(user_data.username):
+        raise user_already_exists_exception(UserAlreadyExists("username"))
+    if await user_service.run(user_service.get_by_email, user_data.email):
+        raise user_already_exists_exception(UserAlreadyExists("email"))
 
-    if user_service.get_by_username(user_data.username):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
-        )
-    
-    if user_service.get_by_email(user_data.email):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
+    try:
+        hashed_password = await password_hasher.hash(user_data.password)
+    except PasswordHasherBusy:
+        raise password_hasher_busy_exception()
+
+    try:
+        user = await user_service.run(
+            user_service.register,
+            username=user_data.username,
+            email=user_data.email,
+            hashed_password=hashed_password
         )
-    
-    user = user_service.create(
-        username=user_data.username,
-        email=user_data.email,
-        password=user_data.password
-    )
+    except UserAlreadyExists as e:
+        raise user_already_exists_exception(e)
     
     return User(
         username=user["username"],
@@ -42,7 +61,10 @@ async def register_user(user_data: UserCreate):
 
 @router.post("/login", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+    try:
+        user = await authenticate_user(form_data.username, form_data.password)
+    except PasswordHasherBusy:
+        raise password_hasher_busy_exception()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,27 @@
+from typing import Iterable
+
+from .client import forget_in_flight_reads
+from ..config import BOOKS_CACHE_SIZE, BOOKS_LIST_CACHE_SIZE, BOOKS_CACHE_TTL
+from ..services.cache import TTLCache
+
+
+# Books by ID as dicts, and encoded list pages and search results keyed by their query parameters.
+# Reads take the cache's generation before calling the backend and pass it to set(), so a
+# response that raced a write invalidating it is not stored.
+book_cache = TTLCache(maxsize=BOOKS_CACHE_SIZE, ttl=BOOKS_CACHE_TTL)
+list_cache = TTLCache(maxsize=BOOKS_LIST_CACHE_SIZE, ttl=BOOKS_CACHE_TTL)
+
+
+def invalidate_books(book_ids: Iterable[int] = ()) -> None:
+    """Forgets the given books and every cached list page or search result, since any write can change them"""
+    for book_id in book_ids:
+        book_cache.pop(book_id)
+    list_cache.clear()
+    forget_in_flight_reads()
+
+
+def clear_books() -> None:
+    """Forgets every cached book, list page and search result"""
+    book_cache.clear()
+    list_cache.clear()
+    forget_in_flight_reads()
@@ -1,18 +1,82 @@
 import sys
 import os
+import time
 import grpc
-from ..config import GRPC_HOST, GRPC_PORT, GRPC_MAX_MESSAGE_SIZE
+from contextvars import ContextVar
+from ..config import (GRPC_HOST, GRPC_PORT, GRPC_MAX_MESSAGE_SIZE, GRPC_COMPRESSION, GRPC_TIMEOUT,
+                      BOOKS_SINGLEFLIGHT_ENABLED)
+from .singleflight import CoalescingStub
 from typing import Optional
 
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
+import books_pb2
 import books_pb2_grpc
+from google.protobuf import descriptor_pb2
+
+
+# Read-only calls, which concurrent requests for the same data can share
+COALESCED_METHODS = ("get_book", "batch_get_books", "list_books", "search_books")
+
+# Monotonic time by which the backend calls of the current HTTP request must finish
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+COMPRESSION_ALGORITHMS = {
+    "none": grpc.Compression.NoCompression,
+    "gzip": grpc.Compression.Gzip,
+    "deflate": grpc.Compression.Deflate,
+}
+
+
+def time_remaining() -> float:
+    """Seconds left until the current request's deadline, or GRPC_TIMEOUT outside of a request"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return GRPC_TIMEOUT
+    return deadline - time.monotonic()
+
+
+def get_compression(name: str) -> grpc.Compression:
+    try:
+        return COMPRESSION_ALGORITHMS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown compression {name!r}, expected one of: {', '.join(COMPRESSION_ALGORITHMS)}")
+
+
+def _serialize_request(message) -> bytes:
+    return message.SerializeToString()
+
+
+class RawBookServiceStub:
+    """BookServiceStub whose calls return serialized response bytes instead of decoded messages"""
+
+    def __init__(self, channel: grpc.aio.Channel):
+        service = descriptor_pb2.ServiceDescriptorProto()
+        books_pb2.DESCRIPTOR.services_by_name["BookService"].CopyToProto(service)
+        full_name = books_pb2.DESCRIPTOR.services_by_name["BookService"].full_name
+        for method in service.method:
+            if method.client_streaming:
+                factory = channel.stream_stream if method.server_streaming else channel.stream_unary
+            else:
+                factory = channel.unary_stream if method.server_streaming else channel.unary_unary
+            setattr(self, method.name, factory(
+                f"/{full_name}/{method.name}",
+                request_serializer=_serialize_request,
+                response_deserializer=None
+            ))
 
 
 class BooksClient:
+    """Process-wide grpc.aio channel to the book service.
+
+    The channel binds to the event loop that is running when it is created,
+    so the stub is created lazily from inside a request handler.
+    """
     _instance: Optional['BooksClient'] = None
+    _channel: Optional[grpc.aio.Channel] = None
     _stub = None
+    _raw_stub = None
 
     def __new__(cls):
         if cls._instance is None:
@@ -25,9 +89,19 @@ class BooksClient:
             ('grpc.max_send_message_length', GRPC_MAX_MESSAGE_SIZE),
             ('grpc.max_receive_message_length', GRPC_MAX_MESSAGE_SIZE),
         ]
-        
-        channel = grpc.insecure_channel(f'{GRPC_HOST}:{GRPC_PORT}', options=options)
-        self._stub = books_pb2_grpc.BookServiceStub(channel)
+
+        # Only affects what the gateway sends, mostly import streams; the server picks
+        # the compression of its responses
+        self._channel = grpc.aio.insecure_channel(
+            f'{GRPC_HOST}:{GRPC_PORT}',
+            options=options,
+            compression=get_compression(GRPC_COMPRESSION)
+        )
+        self._stub = books_pb2_grpc.BookServiceStub(self._channel)
+        self._raw_stub = RawBookServiceStub(self._channel)
+        if BOOKS_SINGLEFLIGHT_ENABLED:
+            self._stub = CoalescingStub(self._stub, COALESCED_METHODS)
+            self._raw_stub = CoalescingStub(self._raw_stub, COALESCED_METHODS)
 
     @property
     def stub(self):
@@ -35,6 +109,38 @@ class BooksClient:
             self._create_stub()
         return self._stub
 
+    @property
+    def raw_stub(self):
+        if self._raw_stub is None:
+            self._create_stub()
+        return self._raw_stub
+
+    async def close(self):
+        if self._channel is not None:
+            await self._channel.close()
+            self._channel = None
+            self._stub = None
+            self._raw_stub = None
+
 
 def get_books_client():
     return BooksClient().stub
+
+
+def get_raw_books_client():
+    """Stub for passing backend responses through without decoding them"""
+    return BooksClient().raw_stub
+
+
+def forget_in_flight_reads() -> None:
+    """Stops new calls from joining reads that started before a write"""
+    client = BooksClient._instance
+    if client is not None:
+        for stub in (client._stub, client._raw_stub):
+            if isinstance(stub, CoalescingStub):
+                stub.forget()
+
+
+async def close_books_client():
+    if BooksClient._instance is not None:
+        await BooksClient._instance.close()
@@ -0,0 +1,64 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+import orjson
+from fastapi import Response
+
+
+def book_to_dict(book) -> Dict[str, Any]:
+    """Converts a books_pb2.Book to a dict with the keys in Book model order, so the JSON matches Book's"""
+    return {"title": book.title, "author": book.author, "year": book.year, "id": book.id}
+
+
+def encode_books(books: Iterable, field_names: Optional[List[str]] = None) -> bytes:
+    """Encodes protobuf books straight to a JSON array, without building a Pydantic model per book"""
+    if field_names is None:
+        return orjson.dumps([book_to_dict(book) for book in books])
+    return orjson.dumps([{name: getattr(book, name) for name in field_names} for book in books])
+
+
+def json_response(body: bytes, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Returns already encoded JSON as is; the route's response_model still documents it in OpenAPI"""
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+PROTOBUF_MEDIA_TYPE = "application/x-protobuf"
+PROTOBUF_MESSAGE_HEADER = "X-Protobuf-Message"
+
+
+def wants_protobuf(accept: Optional[str]) -> bool:
+    """True when the Accept header prefers protobuf to JSON; JSON wins ties and is the default"""
+    if not accept or PROTOBUF_MEDIA_TYPE not in accept:
+        return False
+    quality = {}
+    for item in accept.split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        quality[media_type.lower()] = q
+    protobuf_q = quality.get(PROTOBUF_MEDIA_TYPE, 0.0)
+    json_q = max(quality.get("application/json", 0.0), quality.get("application/*", 0.0), quality.get("*/*", 0.0))
+    return protobuf_q > 0 and protobuf_q > json_q
+
+
+def protobuf_response(body: bytes, message_class, status_code: int = 200,
+                      headers: Optional[Dict[str, str]] = None) -> Response:
+    """Returns backend bytes as they are, naming their message type in the X-Protobuf-Message header"""
+    headers = dict(headers or {})
+    headers[PROTOBUF_MESSAGE_HEADER] = message_class.DESCRIPTOR.full_name
+    return Response(content=body, status_code=status_code, media_type=PROTOBUF_MEDIA_TYPE, headers=headers)
+
+
+def encode_delimited(message: bytes) -> bytes:
+    """Prefixes a serialized message with its varint length, the framing of protobuf's writeDelimitedTo"""
+    size = len(message)
+    prefix = bytearray()
+    while size > 0x7F:
+        prefix.append((size & 0x7F) | 0x80)
+        size >>= 7
+    prefix.append(size)
+    return bytes(prefix) + message
@@ -0,0 +1,94 @@
+import csv
+import json
+from typing import List, Optional
+
+from pydantic import ValidationError
+
+from .models import BookCreate
+
+
+CSV_FORMAT = "csv"
+NDJSON_FORMAT = "ndjson"
+
+IMPORT_FORMATS = {
+    "text/csv": CSV_FORMAT,
+    "application/x-ndjson": NDJSON_FORMAT,
+    "application/jsonl": NDJSON_FORMAT,
+}
+
+
+class BookImportError(ValueError):
+    pass
+
+
+class BookImportParser:
+    """Incrementally parses an uploaded CSV or NDJSON body into books, one chunk at a time"""
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self._buffer = b""
+        self._line_no = 0
+        self._columns: Optional[List[str]] = None
+
+    def feed(self, chunk: bytes) -> List[BookCreate]:
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        return self._parse_lines(lines)
+
+    def close(self) -> List[BookCreate]:
+        lines = [self._buffer]
+        self._buffer = b""
+        books = self._parse_lines(lines)
+        if self.fmt == CSV_FORMAT and self._columns is None:
+            raise BookImportError("CSV body must start with a header row")
+        return books
+
+    def _parse_lines(self, lines: List[bytes]) -> List[BookCreate]:
+        books = []
+        for raw_line in lines:
+            self._line_no += 1
+            try:
+                line = raw_line.decode("utf-8").strip()
+            except UnicodeDecodeError:
+                raise BookImportError(f"Line {self._line_no}: not valid UTF-8")
+            if not line:
+                continue
+
+            if self.fmt == CSV_FORMAT:
+                book = self._parse_csv_line(line)
+            else:
+                book = self._parse_ndjson_line(line)
+
+            if book is not None:
+                books.append(book)
+        return books
+
+    def _parse_csv_line(self, line: str) -> Optional[BookCreate]:
+        values = next(csv.reader([line]))
+        if self._columns is None:
+            columns = [value.strip().lower() for value in values]
+            missing = {"title", "author", "year"} - set(columns)
+            if missing:
+                raise BookImportError(f"CSV header is missing columns: {', '.join(sorted(missing))}")
+            self._columns = columns
+            return None
+
+        if len(values) != len(self._columns):
+            raise BookImportError(f"Line {self._line_no}: expected {len(self._columns)} columns, got {len(values)}")
+        return self._validate(dict(zip(self._columns, values)))
+
+    def _parse_ndjson_line(self, line: str) -> BookCreate:
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise BookImportError(f"Line {self._line_no}: invalid JSON ({e.msg})")
+        if not isinstance(data, dict):
+            raise BookImportError(f"Line {self._line_no}: expected a JSON object")
+        return self._validate(data)
+
+    def _validate(self, data: dict) -> BookCreate:
+        try:
+            return BookCreate(**data)
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            raise BookImportError(f"Line {self._line_no}: {errors}")
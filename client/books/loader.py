@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+from .client import get_books_client
+from ..config import BOOKS_BATCH_ENABLED, BOOKS_BATCH_MAX_IDS, BOOKS_BATCH_WINDOW_MS
+from ..services.metrics import Histogram, registry
+
+import books_pb2
+
+
+batch_sizes = registry.register(Histogram(
+    "gateway_book_loader_batch_ids", "Distinct book IDs per batch_get_books call made by the get_book loader",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)))
+
+
+class BookLoader:
+    """Collects the book IDs requested within window seconds, or until max_ids are pending,
+    and looks them up with a single batch_get_books call.
+
+    Every caller waits for the batch holding its ID, at most for its own timeout; the
+    batch call gets the latest deadline of its callers. Callers asking for the same ID
+    in one window share its lookup. A window of 0 still batches the IDs requested in
+    the same event loop iteration.
+    """
+
+    def __init__(self, window: float, max_ids: int):
+        self.window = window
+        self.max_ids = max_ids
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._deadline = 0.0
+        self._timer: Optional[asyncio.Handle] = None
+
+    async def load(self, book_id: int, timeout: float) -> Optional[books_pb2.Book]:
+        """Returns the book, or None if it does not exist.
+
+        RPC errors are raised to every caller of the batch, and asyncio.TimeoutError to
+        a caller whose timeout passes first.
+        """
+        self._deadline = max(self._deadline, time.monotonic() + timeout)
+        future = self._pending.get(book_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[book_id] = loop.create_future()
+            if len(self._pending) >= self.max_ids:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._dispatch) if self.window > 0 \
+                    else loop.call_soon(self._dispatch)
+        # A caller that goes away must not cancel the lookup for the others
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        deadline, self._deadline = self._deadline, 0.0
+        if batch:
+            batch_sizes.observe((), len(batch))
+            asyncio.ensure_future(self._fetch(batch, deadline))
+
+    async def _fetch(self, batch: Dict[int, asyncio.Future], deadline: float) -> None:
+        try:
+            response = await get_books_client().batch_get_books(
+                books_pb2.BatchGetBooksRequest(ids=list(batch)), timeout=max(deadline - time.monotonic(), 0.001))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+                    # Marks the exception as retrieved in case every caller has gone away
+                    future.exception()
+            return
+
+        books = {book.id: book for book in response.books}
+        for book_id, future in batch.items():
+            if not future.done():
+                future.set_result(books.get(book_id))
+
+
+book_loader = BookLoader(BOOKS_BATCH_WINDOW_MS / 1000, BOOKS_BATCH_MAX_IDS) if BOOKS_BATCH_ENABLED else None
@@ -1,10 +1,17 @@
+from typing import Annotated, List
 from pydantic import BaseModel, Field
 
 
+# Range of the int32 fields in books.proto; values outside it are rejected with 422 instead of failing the request
+INT32_MIN = -2 ** 31
+INT32_MAX = 2 ** 31 - 1
+BookId = Annotated[int, Field(ge=INT32_MIN, le=INT32_MAX)]
+
+
 class BookBase(BaseModel):
     title: str = Field(...)
     author: str = Field(...)
-    year: int = Field(...)
+    year: int = Field(..., ge=INT32_MIN, le=INT32_MAX)
 
 
 class Book(BookBase):
@@ -13,3 +20,22 @@ class Book(BookBase):
 
 class BookCreate(BookBase):
     pass
+
+
+class BookBatchGetRequest(BaseModel):
+    ids: List[BookId] = Field(...)
+
+
+class BookBatchGetResponse(BaseModel):
+    books: List[Book] = Field(...)
+    missing_ids: List[int] = Field(...)
+
+
+class BookIdRange(BaseModel):
+    first_id: int = Field(...)
+    last_id: int = Field(...)
+
+
+class BookImportResult(BaseModel):
+    imported_count: int = Field(...)
+    id_ranges: List[BookIdRange] = Field(...)
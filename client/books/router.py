@@ -1,11 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
+import asyncio
 import grpc
+import orjson
 
-from .models import Book, BookCreate
-from .client import get_books_client
+from .models import (INT32_MAX, INT32_MIN, Book, BookCreate, BookBatchGetRequest, BookBatchGetResponse,
+                     BookIdRange, BookImportResult)
+from .importer import IMPORT_FORMATS, BookImportError, BookImportParser
+from .client import get_books_client, get_raw_books_client, time_remaining
+from .encoding import (PROTOBUF_MEDIA_TYPE, book_to_dict, encode_books, encode_delimited, json_response,
+                       protobuf_response, wants_protobuf)
+from .cache import book_cache, list_cache, invalidate_books
+from .loader import book_loader
 from ..auth.dependencies import get_current_active_user
 from ..auth.models import User
+from ..config import GRPC_STREAM_TIMEOUT
 
 import sys
 import os
@@ -13,79 +23,384 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 import books_pb2
+from google.protobuf.field_mask_pb2 import FieldMask
 
 router = APIRouter(prefix="/books", tags=["Books"])
 
 
-@router.get("", response_model=List[Book])
-async def list_books(current_user: User = Depends(get_current_active_user)):
+NEXT_PAGE_TOKEN_HEADER = "X-Next-Page-Token"
+DEADLINE_EXCEEDED_DETAIL = "Book service did not answer in time"
+FIELDS_DESCRIPTION = "Comma-separated book fields to return, e.g. id,title (all fields when omitted)"
+
+
+def protobuf_responses(message_class, status_code: int = 200, delimited: bool = False) -> dict:
+    """OpenAPI entry for the Accept: application/x-protobuf variant of a route's response"""
+    framing = "a stream of varint length-delimited " if delimited else ""
+    return {status_code: {
+        "description": f"JSON by default, or {framing}{message_class.DESCRIPTOR.full_name} "
+                       f"with Accept: {PROTOBUF_MEDIA_TYPE}",
+        "content": {PROTOBUF_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}}},
+    }}
+
+
+def backend_timeout() -> float:
+    """Timeout for the next backend call: whatever is left of the request's deadline"""
+    remaining = time_remaining()
+    if remaining <= 0:
+        # Not worth sending, and grpc would take a timeout of 0 as no deadline at all
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=DEADLINE_EXCEEDED_DETAIL)
+    return remaining
+
+
+def backend_error(e: grpc.RpcError) -> HTTPException:
+    """Maps a backend failure the route does not handle itself to an HTTP error.
+
+    A service that sheds load or cannot be reached gives 503 with Retry-After, and one
+    that runs out of time 504, so that clients can back off instead of retrying at once.
+    """
+    code = e.code()
+    if code in (grpc.StatusCode.RESOURCE_EXHAUSTED, grpc.StatusCode.UNAVAILABLE):
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                             detail=f"Book service unavailable: {e.details()}", headers={"Retry-After": "1"})
+    if code == grpc.StatusCode.DEADLINE_EXCEEDED:
+        return HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=DEADLINE_EXCEEDED_DETAIL)
+    return HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                         detail=f"gRPC service error: {e.details()}")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parses the fields query parameter into Book field names; None means every field"""
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    if not names or any(name not in Book.model_fields for name in names):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"fields may only contain: {', '.join(Book.model_fields)}")
+    return names
+
+
+@router.get("", response_model=List[Book], responses=protobuf_responses(books_pb2.ListBooksResponse))
+async def list_books(
+        http_request: Request,
+        page_size: Optional[int] = Query(None, ge=1, le=INT32_MAX),
+        page_token: Optional[str] = Query(None),
+        author: Optional[str] = Query(None),
+        min_year: Optional[int] = Query(None, ge=INT32_MIN, le=INT32_MAX),
+        max_year: Optional[int] = Query(None, ge=INT32_MIN, le=INT32_MAX),
+        fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+        current_user: User = Depends(get_current_active_user)
+):
+    """Lists one page of books; the token for the next page is returned in the X-Next-Page-Token header"""
+    field_names = parse_fields(fields)
+    protobuf = wants_protobuf(http_request.headers.get("accept"))
+    cache_key = (page_size, page_token, author, min_year, max_year, field_names and tuple(field_names))
+    cached = None if protobuf else list_cache.get(cache_key)
+    if cached is not None:
+        return list_books_response(*cached)
+
+    # Taken before the call, so a page read before a write that invalidated it is not cached
+    generation = list_cache.generation
     try:
+        request = books_pb2.ListBooksRequest(
+            page_size=page_size or 0,
+            page_token=page_token or "",
+            author=author or "",
+            min_year=min_year,
+            max_year=max_year,
+            read_mask=FieldMask(paths=field_names)
+        )
+        if protobuf:
+            # The next page token is inside the message as well
+            body = await get_raw_books_client().list_books(request, timeout=backend_timeout())
+            return protobuf_response(body, books_pb2.ListBooksResponse)
+
         stub = get_books_client()
-        response = stub.list_books(books_pb2.ListBooksRequest())
+        grpc_response = await stub.list_books(request, timeout=backend_timeout())
+
+        # Pages are cached encoded, so a cache hit returns the bytes as they are
+        body = encode_books(grpc_response.books, field_names)
+        list_cache.set(cache_key, (body, grpc_response.next_page_token), generation)
+        return list_books_response(body, grpc_response.next_page_token)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=DEADLINE_EXCEEDED_DETAIL)
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.details())
+        raise backend_error(e)
+
+
+def list_books_response(body: bytes, next_page_token: str) -> Response:
+    headers = {NEXT_PAGE_TOKEN_HEADER: next_page_token} if next_page_token else None
+    return json_response(body, headers)
+
+
+@router.post(":batchGet", response_model=BookBatchGetResponse,
+             responses=protobuf_responses(books_pb2.BatchGetBooksResponse))
+async def batch_get_books(
+        http_request: Request,
+        batch: BookBatchGetRequest,
+        current_user: User = Depends(get_current_active_user)
+):
+    """Gets several books in one backend call; unknown IDs are reported in missing_ids"""
+    ids = list(dict.fromkeys(batch.ids))
+    if wants_protobuf(http_request.headers.get("accept")):
+        try:
+            body = await get_raw_books_client().batch_get_books(books_pb2.BatchGetBooksRequest(ids=ids),
+                                                                timeout=backend_timeout())
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=DEADLINE_EXCEEDED_DETAIL)
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.details())
+            raise backend_error(e)
+        return protobuf_response(body, books_pb2.BatchGetBooksResponse)
+
+    found = {}
+    for book_id in ids:
+        cached = book_cache.get(book_id)
+        if cached is not None:
+            found[book_id] = cached
+
+    missing_ids = []
+    uncached_ids = [book_id for book_id in ids if book_id not in found]
+    if uncached_ids:
+        generation = book_cache.generation
+        try:
+            stub = get_books_client()
+            response = await stub.batch_get_books(books_pb2.BatchGetBooksRequest(ids=uncached_ids),
+                                                  timeout=backend_timeout())
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=DEADLINE_EXCEEDED_DETAIL)
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.details())
+            raise backend_error(e)
 
-        books = []
         for book in response.books:
-            books.append(Book(
-                id=book.id,
-                title=book.title,
-                author=book.author,
-                year=book.year
-            ))
-
-        return books
+            found[book.id] = book_to_dict(book)
+            book_cache.set(book.id, found[book.id], generation)
+        missing_ids = list(response.missing_ids)
+
+    books = [found[book_id] for book_id in ids if book_id in found]
+    return json_response(orjson.dumps({"books": books, "missing_ids": missing_ids}))
+
+
+@router.post(":import", response_model=BookImportResult, status_code=status.HTTP_201_CREATED,
+             responses=protobuf_responses(books_pb2.ImportBooksResponse, status.HTTP_201_CREATED))
+async def import_books(request: Request, current_user: User = Depends(get_current_active_user)):
+    """Streams a CSV (text/csv, with a title,author,year header) or NDJSON body into a bulk import.
+
+    A malformed line ends the import with 400. The rows before it are imported, and the
+    error detail reports them in imported_count and id_ranges next to the message.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = IMPORT_FORMATS.get(content_type)
+    if fmt is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail=f"Content-Type must be one of: {', '.join(IMPORT_FORMATS)}")
+
+    parser = BookImportParser(fmt)
+    parse_error = None
+
+    async def requests():
+        nonlocal parse_error
+        try:
+            async for chunk in request.stream():
+                for book in parser.feed(chunk):
+                    yield books_pb2.AddBookRequest(title=book.title, author=book.author, year=book.year)
+            for book in parser.close():
+                yield books_pb2.AddBookRequest(title=book.title, author=book.author, year=book.year)
+        except BookImportError as e:
+            # Ending the stream early commits every row before the bad line, so the error can
+            # say exactly what was imported and the client can resume from that line
+            parse_error = e
+
+    protobuf = wants_protobuf(request.headers.get("accept"))
+    try:
+        stub = get_raw_books_client() if protobuf else get_books_client()
+        try:
+            response = await stub.import_books(requests(), timeout=GRPC_STREAM_TIMEOUT)
+        finally:
+            # Batches committed before a failure are visible too
+            invalidate_books()
     except grpc.RpcError as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail=f"gRPC service error: {e.details()}")
+        raise backend_error(e)
+
+    if parse_error is not None:
+        if protobuf:
+            response = books_pb2.ImportBooksResponse.FromString(response)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail={"message": str(parse_error), **import_result(response).model_dump()})
+    if protobuf:
+        return protobuf_response(response, books_pb2.ImportBooksResponse, status.HTTP_201_CREATED)
+    return import_result(response)
+
+
+def import_result(response: books_pb2.ImportBooksResponse) -> BookImportResult:
+    return BookImportResult(
+        imported_count=response.imported_count,
+        id_ranges=[BookIdRange(first_id=r.first_id, last_id=r.last_id) for r in response.id_ranges]
+    )
 
 
-@router.get("/{book_id}", response_model=Book)
-async def get_book(book_id: int, current_user: User = Depends(get_current_active_user)):
+@router.get("/search", response_model=List[Book], responses=protobuf_responses(books_pb2.SearchBooksResponse))
+async def search_books(
+        http_request: Request,
+        q: str = Query(..., min_length=1),
+        limit: Optional[int] = Query(None, ge=1, le=INT32_MAX),
+        current_user: User = Depends(get_current_active_user)
+):
+    """Full-text search over titles and authors; every word must match, as a whole word or a prefix.
+
+    The book service caps limit at its SEARCH_MAX_LIMIT.
+    """
+    protobuf = wants_protobuf(http_request.headers.get("accept"))
+    cache_key = ("search", q, limit)
+    cached = None if protobuf else list_cache.get(cache_key)
+    if cached is not None:
+        return json_response(cached)
+
+    generation = list_cache.generation
     try:
+        request = books_pb2.SearchBooksRequest(query=q, limit=limit or 0)
+        if protobuf:
+            body = await get_raw_books_client().search_books(request, timeout=backend_timeout())
+            return protobuf_response(body, books_pb2.SearchBooksResponse)
+
         stub = get_books_client()
-        response = stub.get_book(books_pb2.BookRequest(id=book_id))
+        response = await stub.search_books(request, timeout=backend_timeout())
 
-        return Book(
-            id=response.book.id,
-            title=response.book.title,
-            author=response.book.author,
-            year=response.book.year
-        )
+        body = encode_books(response.books)
+        list_cache.set(cache_key, body, generation)
+        return json_response(body)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=DEADLINE_EXCEEDED_DETAIL)
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.details())
+        raise backend_error(e)
+
+
+@router.get("/stream", responses=protobuf_responses(books_pb2.Book, delimited=True))
+async def stream_books(request: Request, current_user: User = Depends(get_current_active_user)):
+    """Streams all books as newline-delimited JSON without buffering the full list"""
+    protobuf = wants_protobuf(request.headers.get("accept"))
+    stub = get_raw_books_client() if protobuf else get_books_client()
+    call = stub.stream_books(books_pb2.StreamBooksRequest(), timeout=GRPC_STREAM_TIMEOUT)
+
+    try:
+        # Read the first message before answering so backend errors still map to a status code
+        first = await call.read()
+    except grpc.RpcError as e:
+        raise backend_error(e)
+
+    async def generate():
+        try:
+            book = first
+            while book is not grpc.aio.EOF:
+                if protobuf:
+                    yield encode_delimited(book)
+                else:
+                    yield orjson.dumps(book_to_dict(book)) + b"\n"
+                book = await call.read()
+        finally:
+            call.cancel()
+
+    if protobuf:
+        # Each Book is prefixed with its varint length, as written by writeDelimitedTo
+        return StreamingResponse(generate(), media_type=PROTOBUF_MEDIA_TYPE,
+                                 headers={"X-Protobuf-Message": books_pb2.Book.DESCRIPTOR.full_name})
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.get("/{book_id}", response_model=Book, responses=protobuf_responses(books_pb2.BookResponse))
+async def get_book(
+        http_request: Request,
+        book_id: int,
+        fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+        current_user: User = Depends(get_current_active_user)
+):
+    field_names = parse_fields(fields)
+    protobuf = wants_protobuf(http_request.headers.get("accept"))
+    cached = None if protobuf else book_cache.get(book_id)
+    if cached is not None:
+        if field_names is not None:
+            return JSONResponse(content={name: cached[name] for name in field_names})
+        return cached
+
+    generation = book_cache.generation
+    try:
+        request = books_pb2.BookRequest(id=book_id, read_mask=FieldMask(paths=field_names))
+        if protobuf:
+            body = await get_raw_books_client().get_book(request, timeout=backend_timeout())
+            return protobuf_response(body, books_pb2.BookResponse)
+
+        if book_loader is not None:
+            # Full books are loaded in batches; the requested fields are picked here
+            found = await book_loader.load(book_id, backend_timeout())
+            if found is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                    detail=f"Book with ID {book_id} not found")
+        else:
+            stub = get_books_client()
+            found = (await stub.get_book(request, timeout=backend_timeout())).book
+
+        if field_names is not None:
+            return JSONResponse(content={name: getattr(found, name) for name in field_names})
+
+        book = book_to_dict(found)
+        book_cache.set(book_id, book, generation)
+        return book
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=DEADLINE_EXCEEDED_DETAIL)
     except grpc.RpcError as e:
         if e.code() == grpc.StatusCode.NOT_FOUND:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"Book with ID {book_id} not found")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail=f"gRPC service error: {e.details()}")
+        raise backend_error(e)
 
 
-@router.post("", response_model=Book, status_code=status.HTTP_201_CREATED)
-async def create_book(book: BookCreate, current_user: User = Depends(get_current_active_user)):
+@router.post("", response_model=Book, status_code=status.HTTP_201_CREATED,
+             responses=protobuf_responses(books_pb2.BookResponse, status.HTTP_201_CREATED))
+async def create_book(
+        http_request: Request,
+        book: BookCreate,
+        current_user: User = Depends(get_current_active_user)
+):
     try:
-        stub = get_books_client()
         request = books_pb2.AddBookRequest(
             title=book.title,
             author=book.author,
             year=book.year
         )
+        if wants_protobuf(http_request.headers.get("accept")):
+            body = await get_raw_books_client().add_book(request, timeout=backend_timeout())
+            # The new book is not decoded, so it is not cached either
+            invalidate_books()
+            return protobuf_response(body, books_pb2.BookResponse, status.HTTP_201_CREATED)
 
-        response = stub.add_book(request)
+        stub = get_books_client()
+        response = await stub.add_book(request, timeout=backend_timeout())
 
-        return Book(
-            id=response.book.id,
-            title=response.book.title,
-            author=response.book.author,
-            year=response.book.year
-        )
+        created = book_to_dict(response.book)
+        invalidate_books()
+        book_cache.set(created["id"], created)
+        return created
     except grpc.RpcError as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail=f"gRPC service error: {e.details()}")
+        raise backend_error(e)
 
 
-@router.delete("/{book_id}")
-async def delete_book(book_id: int, current_user: User = Depends(get_current_active_user)):
+@router.delete("/{book_id}", responses=protobuf_responses(books_pb2.DeleteBookResponse))
+async def delete_book(http_request: Request, book_id: int, current_user: User = Depends(get_current_active_user)):
     try:
+        if wants_protobuf(http_request.headers.get("accept")):
+            body = await get_raw_books_client().delete_book(books_pb2.BookRequest(id=book_id), timeout=backend_timeout())
+            invalidate_books([book_id])
+            return protobuf_response(body, books_pb2.DeleteBookResponse)
+
         stub = get_books_client()
-        response = stub.delete_book(books_pb2.BookRequest(id=book_id))
+        response = await stub.delete_book(books_pb2.BookRequest(id=book_id), timeout=backend_timeout())
+        invalidate_books([book_id])
 
         if response.success:
             return {"success": True, "message": response.message}
@@ -93,7 +408,7 @@ async def delete_book(book_id: int, current_user: User = Depends(get_current_act
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=response.message)
     except grpc.RpcError as e:
         if e.code() == grpc.StatusCode.NOT_FOUND:
+            invalidate_books([book_id])
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"Book with ID {book_id} not found")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail=f"gRPC service error: {e.details()}")
+        raise backend_error(e)
@@ -0,0 +1,97 @@
+import asyncio
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional
+
+import grpc
+
+from ..services.metrics import Counter, registry
+
+
+calls_total = registry.register(Counter(
+    "gateway_singleflight_calls_total", "Coalesced backend calls made by request handlers, by method", ("method",)))
+deduplicated_total = registry.register(Counter(
+    "gateway_singleflight_deduplicated_total",
+    "Calls that joined an identical call already in flight instead of making their own, by method", ("method",)))
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers arriving while it is in flight share its outcome.
+
+    The call runs in its own task, so a caller that goes away does not cancel it for
+    the others, and every caller receives the same result or the same exception.
+    Each caller waits for it at most for its own timeout. A caller that joined a call
+    which then failed with an error accepted by retry_if, e.g. because it ran out of
+    the first caller's time, makes its own call with whatever time it has left.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[Optional[float]], Awaitable[Any]], label: str,
+                 timeout: Optional[float] = None,
+                 retry_if: Optional[Callable[[BaseException], bool]] = None) -> Any:
+        """Returns the outcome of fn(timeout) for key; raises asyncio.TimeoutError once timeout passes"""
+        calls_total.inc((label,))
+        deadline = math.inf if timeout is None else time.monotonic() + timeout
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(timeout))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+        deduplicated_total.inc((label,))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except Exception as e:
+            remaining = None if timeout is None else deadline - time.monotonic()
+            if retry_if is None or not retry_if(e) or (remaining is not None and remaining <= 0):
+                raise
+        return await asyncio.wait_for(fn(remaining), remaining)
+
+    def _done(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieved here so that a failure nobody waits for any more is not reported as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    def forget(self) -> None:
+        """Makes later callers start new calls instead of joining the ones in flight, e.g. after a write"""
+        self._calls.clear()
+
+
+def _deadline_exceeded(e: BaseException) -> bool:
+    return isinstance(e, grpc.RpcError) and e.code() == grpc.StatusCode.DEADLINE_EXCEEDED
+
+
+class CoalescingStub:
+    """Wraps a grpc.aio stub so that concurrent calls of the given unary methods with
+    identical requests share one RPC; other methods are passed through untouched.
+
+    A shared call raises asyncio.TimeoutError to a caller whose timeout passes first, and
+    a caller left with time when the RPC it joined hits its deadline retries on its own.
+    """
+
+    def __init__(self, stub: Any, methods: Iterable[str]):
+        self._stub = stub
+        self._flight = SingleFlight()
+        for name in methods:
+            setattr(self, name, self._coalesce(name, getattr(stub, name)))
+
+    def _coalesce(self, name: str, method: Callable) -> Callable:
+        async def call(request, timeout=None, **kwargs):
+            if kwargs:
+                # Metadata or credentials may change the answer, so those calls are never shared
+                return await method(request, timeout=timeout, **kwargs)
+            key = (name, request.SerializeToString(deterministic=True))
+            return await self._flight.do(key, lambda remaining: method(request, timeout=remaining), name, timeout,
+                                         retry_if=_deadline_exceeded)
+        return call
+
+    def forget(self) -> None:
+        self._flight.forget()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stub, name)
@@ -0,0 +1,64 @@
+import asyncio
+from typing import Optional
+
+import grpc
+
+from .cache import clear_books, invalidate_books
+from .client import get_books_client
+from ..services.metrics import Counter, registry
+
+import books_pb2
+
+
+events_applied = registry.register(Counter(
+    "gateway_book_events_total", "Book events received from watch_books, by type", ("type",)))
+
+
+class BookWatcher:
+    """Follows watch_books in the background so that writes made through any gateway
+    replica, or straight to the server, invalidate this gateway's book caches.
+
+    After a disconnect the watch resumes from the last applied version; when the
+    server cannot replay from there it sends RESET and every cached book is dropped.
+    """
+
+    def __init__(self, retry_delay: float = 0.5, max_retry_delay: float = 30):
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.version = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def apply(self, event: books_pb2.BookEvent) -> None:
+        if event.type == books_pb2.BookEvent.RESET:
+            clear_books()
+        else:
+            invalidate_books([event.book_id])
+        self.version = event.version
+        events_applied.inc((books_pb2.BookEvent.Type.Name(event.type),))
+
+    async def _run(self) -> None:
+        delay = self.retry_delay
+        while True:
+            try:
+                call = get_books_client().watch_books(books_pb2.WatchBooksRequest(from_version=self.version))
+                async for event in call:
+                    self.apply(event)
+                    delay = self.retry_delay
+                print("Book watch ended by the server, reconnecting")
+            except grpc.RpcError as e:
+                print(f"Book watch failed ({e.code().name}: {e.details()}), retrying in {delay:g}s")
+            # Writes made while disconnected are replayed on reconnect, or cleared by a RESET
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
@@ -12,11 +12,38 @@ API_PORT = int(os.getenv("API_PORT", "8001"))
 GRPC_HOST = os.getenv("GRPC_HOST", "localhost")
 GRPC_PORT = os.getenv("GRPC_PORT", "50051")
 GRPC_MAX_MESSAGE_SIZE = int(os.getenv("GRPC_MAX_MESSAGE_SIZE", "50")) * 1024 * 1024
+GRPC_TIMEOUT = float(os.getenv("GRPC_TIMEOUT", "5"))  # deadline in seconds for the backend calls of one request
+GRPC_STREAM_TIMEOUT = float(os.getenv("GRPC_STREAM_TIMEOUT", "300"))  # deadline for stream/import calls in seconds
+GRPC_COMPRESSION = os.getenv("GRPC_COMPRESSION", "none")  # none, gzip or deflate for messages sent to the server
+
+# Gateway cache settings
+BOOKS_CACHE_SIZE = int(os.getenv("BOOKS_CACHE_SIZE", "1024"))  # cached books, 0 disables the cache
+BOOKS_LIST_CACHE_SIZE = int(os.getenv("BOOKS_LIST_CACHE_SIZE", "128"))  # cached list pages
+BOOKS_CACHE_TTL = float(os.getenv("BOOKS_CACHE_TTL", "30"))  # in seconds
+BOOKS_SINGLEFLIGHT_ENABLED = os.getenv("BOOKS_SINGLEFLIGHT_ENABLED", "true").lower() == "true"  # share identical reads in flight
+BOOKS_BATCH_ENABLED = os.getenv("BOOKS_BATCH_ENABLED", "true").lower() == "true"  # batch concurrent get_book lookups
+BOOKS_BATCH_WINDOW_MS = float(os.getenv("BOOKS_BATCH_WINDOW_MS", "0"))  # 0 batches what arrives in one loop iteration
+BOOKS_BATCH_MAX_IDS = int(os.getenv("BOOKS_BATCH_MAX_IDS", "100"))  # a full batch is sent at once
+BOOKS_WATCH_ENABLED = os.getenv("BOOKS_WATCH_ENABLED", "true").lower() == "true"  # invalidate on writes via other replicas
 
 # JWT settings
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "gcvyhgviyviuvuvgui")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
+# Password hashing settings
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # bcrypt cost factor
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))  # running + queued, beyond that fail fast
+
 # Database settings
 DB_PATH = os.getenv("DB_PATH", "books.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))  # in ms
+
+# Authenticated user cache settings
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))  # cached users, 0 disables the cache
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))  # in seconds
+
+# Profiling settings
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"  # exposes GET /debug/profile
@@ -1,19 +1,48 @@
 import uvicorn
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 from .auth.router import router as auth_router
 from .books.router import router as books_router
-from .config import API_HOST, API_PORT
+from .auth.dependencies import get_current_active_user
+from .auth.models import User
+from .books.cache import book_cache, list_cache
+from .books.client import close_books_client
+from .books.watcher import BookWatcher
+from .config import API_HOST, API_PORT, BOOKS_WATCH_ENABLED, PROFILING_ENABLED
+from .middleware import DeadlineMiddleware, MetricsMiddleware
 from .services.database import init_db
+from .services.metrics import CONTENT_TYPE, cache_collector, registry
+from .services.profiling import PROFILE_MAX_SECONDS, ProfilerBusy, profiler
+from .services.user_service import user_service
 
 
 init_db()
 
+registry.add_collector(cache_collector({
+    "books": book_cache.stats,
+    "lists": list_cache.stats,
+    "users": user_service.cache_stats,
+}))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watcher = BookWatcher()
+    if BOOKS_WATCH_ENABLED:
+        watcher.start()
+    yield
+    await watcher.stop()
+    await close_books_client()
+
+
 app = FastAPI(
     title="API Gateway",
     description="API Gateway for Book Service with Authentication",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -22,12 +51,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Page-Token"],
 )
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth_router)
 app.include_router(books_router)
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics of the gateway"""
+    return Response(registry.render(), headers={"Content-Type": CONTENT_TYPE})
+
+
+@app.get("/debug/profile", include_in_schema=False)
+async def profile(
+        seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+        current_user: User = Depends(get_current_active_user)
+):
+    """Samples every thread of the gateway for the given time and returns collapsed stacks"""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    try:
+        stacks = await run_in_threadpool(profiler.profile, seconds)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return Response(stacks, media_type="text/plain")
+
+
 @app.get("/", tags=["Root"])
 async def read_root():
     return {
@@ -38,10 +91,17 @@ async def read_root():
                 "POST /login": "Get access token",
                 "GET /users/me": "Get current user info"
             },
+            "Monitoring": {
+                "GET /metrics": "Prometheus metrics"
+            },
             "Books": {
-                "GET /books": "List all books",
+                "GET /books": "List books page by page (filters: author, min_year, max_year)",
+                "GET /books/stream": "Stream all books as NDJSON",
+                "GET /books/search?q=": "Full-text search over titles and authors",
                 "GET /books/{book_id}": "Get a book by ID",
+                "POST /books:batchGet": "Get several books by ID",
                 "POST /books": "Add a new book",
+                "POST /books:import": "Bulk import books from a CSV or NDJSON body",
                 "DELETE /books/{book_id}": "Delete a book by ID"
             }
         }
@@ -1,6 +1,15 @@
+import queue
 import sqlite3
-from typing import Any
-from ..config import DB_PATH
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..config import DB_PATH, DB_POOL_SIZE, DB_BUSY_TIMEOUT
+
+
+T = TypeVar("T")
 
 
 def get_db_connection():
@@ -13,6 +22,9 @@ def init_db():
     conn = get_db_connection()
     cursor = conn.cursor()
 
+    # WAL is persistent in the database file and lets readers run alongside a writer
+    cursor.execute("PRAGMA journal_mode = WAL")
+
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -22,48 +34,139 @@ def init_db():
         disabled BOOLEAN NOT NULL DEFAULT 0
     )
     ''')
-    
+
     conn.commit()
     conn.close()
 
 
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections opened lazily, up to size connections.
+
+    Connections run in autocommit mode, so a single statement commits on its own
+    and several statements are grouped with an explicit transaction.
+    """
+
+    def __init__(self, db_path: str, size: int, busy_timeout: int):
+        self.db_path = db_path
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Checks out a connection, blocking while all of them are in use"""
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH, size=DB_POOL_SIZE, busy_timeout=DB_BUSY_TIMEOUT)
+    return _pool
+
+
 class DatabaseService:
-    
-    def execute_query(self, query: str, params: tuple = ()) -> Any:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        return conn, cursor
-    
-    def fetch_one(self, query: str, params: tuple = ()) -> dict:
-        conn, cursor = self.execute_query(query, params)
-        result = cursor.fetchone()
-        conn.close()
-        
+    """Query helpers over the shared connection pool.
+
+    Every helper accepts an optional conn; pass the connection yielded by
+    transaction() to run several statements on one connection with one commit.
+    The helpers block, so async handlers should go through run().
+    """
+
+    @contextmanager
+    def connection(self, conn: Optional[sqlite3.Connection] = None) -> Iterator[sqlite3.Connection]:
+        if conn is not None:
+            yield conn
+            return
+        with get_pool().connection() as pooled:
+            yield pooled
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Yields a connection inside a write transaction that commits on success and rolls back on error"""
+        with get_pool().connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Runs blocking database work in the threadpool so it does not stall the event loop"""
+        return await run_in_threadpool(fn, *args, **kwargs)
+
+    def execute_query(self, conn: sqlite3.Connection, query: str, params: tuple = ()) -> sqlite3.Cursor:
+        return conn.execute(query, params)
+
+    def fetch_one(self, query: str, params: tuple = (), conn: Optional[sqlite3.Connection] = None) -> dict:
+        with self.connection(conn) as conn:
+            result = self.execute_query(conn, query, params).fetchone()
+
         if result:
             return dict(result)
         return None
-    
-    def fetch_all(self, query: str, params: tuple = ()) -> list:
-        conn, cursor = self.execute_query(query, params)
-        results = cursor.fetchall()
-        conn.close()
-        
+
+    def fetch_all(self, query: str, params: tuple = (), conn: Optional[sqlite3.Connection] = None) -> list:
+        with self.connection(conn) as conn:
+            results = self.execute_query(conn, query, params).fetchall()
+
         return [dict(row) for row in results]
-    
-    def execute(self, query: str, params: tuple = ()) -> int:
-        conn, cursor = self.execute_query(query, params)
-        last_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
+
+    def execute(self, query: str, params: tuple = (), conn: Optional[sqlite3.Connection] = None) -> int:
+        with self.connection(conn) as conn:
+            last_id = self.execute_query(conn, query, params).lastrowid
+
         return last_id
-    
-    def execute_update(self, query: str, params: tuple = ()) -> int:
-        conn, cursor = self.execute_query(query, params)
-        affected_rows = cursor.rowcount
-        conn.commit()
-        conn.close()
-        
+
+    def execute_update(self, query: str, params: tuple = (), conn: Optional[sqlite3.Connection] = None) -> int:
+        with self.connection(conn) as conn:
+            affected_rows = self.execute_query(conn, query, params).rowcount
+
         return affected_rows
- 
\ No newline at end of file
@@ -0,0 +1,138 @@
+import threading
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Upper bounds in seconds for request latency and in bytes for response sizes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[str, ...]
+# (name, type, documentation, [(labels, value)]) as returned by a collector
+CollectedMetric = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    """Base of a metric family; samples are keyed by a tuple of label values"""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Labels, Any] = {}
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            lines.extend(self._render_samples(sorted(self._values.items())))
+        return lines
+
+    def _render_samples(self, items: List[Tuple[Labels, Any]]) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {value}" for labels, value in items]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; an observation costs one bisect and a few additions"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels: Labels, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self._values.get(labels)
+            if sample is None:
+                # Per-bucket counts with a trailing +Inf bucket, then the sum
+                sample = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            sample[index] += 1
+            sample[-1] += value
+
+    def _render_samples(self, items: List[Tuple[Labels, Any]]) -> List[str]:
+        lines = []
+        for labels, sample in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), sample):
+                cumulative += count
+                bucket_labels = _format_labels(self.label_names + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            series = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{series} {sample[-1]}")
+            lines.append(f"{self.name}_count{series} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metric families plus collectors that are only read when the metrics are scraped"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[CollectedMetric]]] = []
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[CollectedMetric]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, type_name, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {type_name}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def cache_collector(caches: Dict[str, Callable[[], Dict[str, Any]]]) -> Callable[[], List[CollectedMetric]]:
+    """Collector exporting TTLCache.stats() of each named cache"""
+    def collect() -> List[CollectedMetric]:
+        stats = {name: get_stats() for name, get_stats in caches.items()}
+        return [
+            (name, type_name, documentation, [({"cache": cache}, cache_stats[key]) for cache, cache_stats in stats.items()])
+            for name, key, type_name, documentation in (
+                ("gateway_cache_entries", "size", "gauge", "Entries in the cache"),
+                ("gateway_cache_hits_total", "hits", "counter", "Lookups served from the cache"),
+                ("gateway_cache_misses_total", "misses", "counter", "Lookups that missed the cache"),
+                ("gateway_cache_evictions_total", "evictions", "counter", "Entries evicted to stay under the size limit"),
+            )
+        ]
+    return collect
+
+
+registry = Registry()
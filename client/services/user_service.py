@@ -1,35 +1,67 @@
+import sqlite3
 from typing import Dict, Optional, Any
-import bcrypt
+from .cache import TTLCache
 from .database import DatabaseService
+from .password_hasher import password_hasher
+from ..config import USER_CACHE_SIZE, USER_CACHE_TTL
+
+
+class UserAlreadyExists(Exception):
+
+    def __init__(self, field: str):
+        super().__init__(f"{field.capitalize()} already registered")
+        self.field = field
 
 
 class UserService(DatabaseService):
+
+    def __init__(self):
+        # Users by username; every authenticated request looks one up after validating its token
+        self._cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
     
-    def get_by_username(self, username: str) -> Optional[Dict[str, Any]]:
-        return self.fetch_one(
+    def get_by_username(self, username: str, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        cached = self._cache.get(username)
+        if cached is not None:
+            return dict(cached)
+
+        # Taken before reading, so a row read just before an update's invalidate() is not cached
+        generation = self._cache.generation
+        user = self.fetch_one(
             "SELECT * FROM users WHERE username = ?", 
-            (username,)
+            (username,),
+            conn
         )
+        if user:
+            self._cache.set(username, dict(user), generation)
+        return user
+
+    async def get_by_username_async(self, username: str) -> Optional[Dict[str, Any]]:
+        """Like get_by_username, but only leaves the event loop on a cache miss"""
+        cached = self._cache.get(username)
+        if cached is not None:
+            return dict(cached)
+        return await self.run(self.get_by_username, username)
     
-    def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+    def get_by_email(self, email: str, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
         return self.fetch_one(
             "SELECT * FROM users WHERE email = ?", 
-            (email,)
+            (email,),
+            conn
         )
     
-    def get_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
+    def get_by_id(self, user_id: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
         return self.fetch_one(
             "SELECT * FROM users WHERE id = ?", 
-            (user_id,)
+            (user_id,),
+            conn
         )
     
-    def create(self, username: str, email: str, password: str) -> Dict[str, Any]:
-        salt = bcrypt.gensalt()
-        hashed_password = bcrypt.hashpw(password.encode(), salt).decode()
-        
+    def create(self, username: str, email: str, hashed_password: str,
+               conn: Optional[sqlite3.Connection] = None) -> Dict[str, Any]:
         user_id = self.execute(
             "INSERT INTO users (username, email, hashed_password, disabled) VALUES (?, ?, ?, ?)",
-            (username, email, hashed_password, False)
+            (username, email, hashed_password, False),
+            conn
         )
         
         return {
@@ -39,6 +71,15 @@ class UserService(DatabaseService):
             "hashed_password": hashed_password,
             "disabled": False
         }
+
+    def register(self, username: str, email: str, hashed_password: str) -> Dict[str, Any]:
+        """Checks that the username and email are free and creates the user in one transaction"""
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone():
+                raise UserAlreadyExists("username")
+            if conn.execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone():
+                raise UserAlreadyExists("email")
+            return self.create(username, email, hashed_password, conn)
     
     def update(self, user_id: int, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         set_parts = []
@@ -50,26 +91,37 @@ class UserService(DatabaseService):
                 values.append(value)
             elif key == "password":
                 set_parts.append("hashed_password = ?")
-                salt = bcrypt.gensalt()
-                hashed_password = bcrypt.hashpw(value.encode(), salt).decode()
-                values.append(hashed_password)
+                values.append(password_hasher.hash_sync(value))
         
         if not set_parts:
             return None
         
         values.append(user_id)
-        
-        affected_rows = self.execute_update(
-            f"UPDATE users SET {', '.join(set_parts)} WHERE id = ?",
-            tuple(values)
-        )
-        
-        if affected_rows == 0:
-            return None
-        return self.get_by_id(user_id)
+
+        with self.transaction() as conn:
+            existing = self.get_by_id(user_id, conn)
+            if existing is None:
+                return None
+
+            self.execute_update(
+                f"UPDATE users SET {', '.join(set_parts)} WHERE id = ?",
+                tuple(values),
+                conn
+            )
+            updated = self.get_by_id(user_id, conn)
+
+        self.invalidate(existing["username"])
+        return updated
+
+    def invalidate(self, username: str) -> None:
+        """Drops a cached user so the next lookup reads the current row"""
+        self._cache.pop(username)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+        return password_hasher.verify_sync(plain_password, hashed_password)
 
 
 user_service = UserService()
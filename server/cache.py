@@ -0,0 +1,123 @@
+import multiprocessing
+import threading
+from collections import OrderedDict
+
+
+class SharedInvalidations:
+    """Ring buffer in shared memory of the most recently invalidated integer keys.
+
+    Created before forking, it lets the ResponseCache of every worker process drop
+    the keys invalidated by the others. A reader that falls more than size
+    invalidations behind cannot tell which keys it missed and must clear everything.
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self._sequence = multiprocessing.RawValue('q', 0)
+        self._keys = multiprocessing.RawArray('q', size)
+        self._lock = multiprocessing.Lock()
+
+    @property
+    def sequence(self):
+        return self._sequence.value
+
+    def publish(self, key):
+        with self._lock:
+            sequence = self._sequence.value
+            self._keys[sequence % self.size] = key
+            self._sequence.value = sequence + 1
+
+    def since(self, sequence):
+        """Returns (keys invalidated after sequence, new sequence); keys is None if some were overwritten"""
+        current = self._sequence.value
+        if current - sequence > self.size:
+            return None, current
+        keys = [self._keys[i % self.size] for i in range(sequence, current)]
+        # Writers may have lapped the reader while it was copying
+        if self._sequence.value - sequence > self.size:
+            return None, self._sequence.value
+        return keys, current
+
+
+class ResponseCache:
+    """Bounded LRU cache of serialized responses keyed by book ID.
+
+    Every invalidation bumps a generation counter. Readers take the generation
+    before querying the database and pass it to set(), which drops the value if
+    an invalidation happened in between, so a read racing a delete can never
+    store a stale response. A maxsize of 0 disables the cache.
+
+    With shared set, invalidations are also published to the other worker
+    processes, and theirs are applied here before every lookup.
+    """
+
+    def __init__(self, maxsize, shared=None):
+        self.maxsize = maxsize
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._generation = 0
+        self._synced = shared.sequence if shared is not None else 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self):
+        if self.shared is not None:
+            with self._lock:
+                self._sync()
+        return self._generation
+
+    def _sync(self):
+        """Applies invalidations published by other processes; called with the lock held"""
+        if self.shared.sequence == self._synced:
+            return
+        keys, self._synced = self.shared.since(self._synced)
+        self._generation += 1
+        if keys is None:
+            self._data.clear()
+            return
+        for key in keys:
+            self._data.pop(key, None)
+
+    def get(self, key):
+        with self._lock:
+            if self.shared is not None:
+                self._sync()
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if self.shared is not None:
+                self._sync()
+            if generation != self._generation:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+        if self.shared is not None:
+            self.shared.publish(key)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
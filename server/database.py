@@ -0,0 +1,123 @@
+import queue
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from tracing import current_trace
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that adds the time spent fetching rows to its statement's span"""
+    trace = None
+    sql = None
+
+    def _timed(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self.trace.add('sql', self.sql, time.perf_counter() - start, calls=0)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection that times its statements into the current trace, if there is one"""
+
+    def execute(self, sql, parameters=()):
+        trace = current_trace.get()
+        if trace is None:
+            return super().execute(sql, parameters)
+        cursor = self.cursor(TracedCursor)
+        cursor.trace, cursor.sql = trace, sql
+        start = time.perf_counter()
+        try:
+            return cursor.execute(sql, parameters)
+        finally:
+            trace.add('sql', sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        trace = current_trace.get()
+        if trace is None:
+            return super().executemany(sql, seq_of_parameters)
+        with trace.span('sql', sql):
+            return super().executemany(sql, seq_of_parameters)
+
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections shared by the server's worker threads.
+
+    Connections are opened once in autocommit mode with the configured pragmas and
+    handed out for the duration of a single unit of work, so each request reuses an
+    open connection and its statement cache instead of reconnecting.
+    """
+
+    def __init__(self, db_path, size, journal_mode='WAL', synchronous='NORMAL', cache_size=-16000,
+                 mmap_size=268435456, busy_timeout=5000, cached_statements=256):
+        self.db_path = db_path
+        self.size = size
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+
+        self._connections = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._connections.put(self._connect())
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=TracedConnection
+        )
+        conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Checks out a connection, blocking while all of them are in use"""
+        conn = self._connections.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._connections.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Checks out a connection inside a write transaction that commits on success"""
+        with self.connection() as conn:
+            # IMMEDIATE takes the write lock up front instead of failing on upgrade later
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        while True:
+            try:
+                conn = self._connections.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
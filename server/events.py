@@ -0,0 +1,154 @@
+import asyncio
+import threading
+import time
+
+import books_pb2
+
+ADDED = books_pb2.BookEvent.ADDED
+DELETED = books_pb2.BookEvent.DELETED
+RESET = books_pb2.BookEvent.RESET
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ChangeFeed:
+    """Reads the book_events log and wakes watch_books streams when it grows.
+
+    Events are written by triggers on the books table, so every write path and every
+    worker process feeds the log. Writes made by this process wake its watchers at
+    once through refresh(); a poller thread picks up the other processes' writes
+    every poll_interval seconds and prunes all but the newest retention events.
+    """
+
+    def __init__(self, pool, max_watchers, poll_interval=0.25, retention=100000, prune_interval=60):
+        self.pool = pool
+        self.max_watchers = max_watchers
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self.version = 0
+        self.closed = False
+        self._watchers = 0
+        self._condition = threading.Condition()
+        self._async_waiters = set()
+        self._stopped = threading.Event()
+
+    def start(self):
+        self.version = self.latest_version()
+        threading.Thread(target=self._poll, name='book-events', daemon=True).start()
+
+    def close(self):
+        """Ends every watch so that shutdown does not wait for them"""
+        self.closed = True
+        self._stopped.set()
+        self._notify()
+
+    def add_watcher(self):
+        """Returns False when max_watchers streams are already open; a max_watchers of 0 means no limit"""
+        with self._condition:
+            if self.max_watchers and self._watchers >= self.max_watchers:
+                return False
+            self._watchers += 1
+            return True
+
+    def remove_watcher(self):
+        with self._condition:
+            self._watchers -= 1
+
+    def latest_version(self):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(version), 0) FROM book_events").fetchone()[0]
+
+    def refresh(self):
+        """Wakes the watchers if the log grew; called after every local write"""
+        if self._watchers:
+            self._advance(self.latest_version())
+
+    def _advance(self, version):
+        with self._condition:
+            if version <= self.version:
+                return
+            self.version = version
+        self._notify()
+
+    def _notify(self):
+        with self._condition:
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, set()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def wait(self, version, timeout):
+        """Blocks until an event newer than version exists, the feed is closed or timeout passes"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version > version or self.closed, timeout)
+
+    async def wait_async(self, version):
+        """wait() for grpc.aio streams, which must not block the event loop"""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._condition:
+            if self.version > version or self.closed:
+                return
+            self._async_waiters.add(waiter)
+        try:
+            await waiter[1]
+        finally:
+            with self._condition:
+                self._async_waiters.discard(waiter)
+
+    def read(self, after, limit):
+        """Returns up to limit events newer than version after, oldest first.
+
+        When those events cannot be replayed, because after is 0, pruned or from
+        another database, the result is a single RESET event at the latest version.
+        """
+        with self.pool.connection() as conn:
+            rows = []
+            if after > 0:
+                # Added books are read along with their event; one deleted since has no row left
+                rows = conn.execute(
+                    """
+                    SELECT e.version, e.type, e.book_id, b.title, b.author, b.year
+                    FROM book_events e LEFT JOIN books b ON e.type = ? AND b.id = e.book_id
+                    WHERE e.version > ?
+                    ORDER BY e.version
+                    LIMIT ?
+                    """,
+                    (ADDED, after, limit)
+                ).fetchall()
+                # Versions have no gaps, so a missing successor means it was pruned
+                if rows and rows[0][0] == after + 1:
+                    return [self._event(row) for row in rows]
+            latest = conn.execute("SELECT COALESCE(MAX(version), 0) FROM book_events").fetchone()[0]
+
+        if rows or after <= 0 or after > latest:
+            return [books_pb2.BookEvent(version=latest, type=RESET)]
+        return []
+
+    def _event(self, row):
+        version, event_type, book_id, title, author, year = row
+        book = books_pb2.Book(id=book_id, title=title, author=author, year=year) if title is not None else None
+        return books_pb2.BookEvent(version=version, type=event_type, book_id=book_id, book=book)
+
+    def prune(self):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "DELETE FROM book_events WHERE version <= (SELECT MAX(version) FROM book_events) - ?",
+                (self.retention,)
+            )
+
+    def _poll(self):
+        next_prune = time.monotonic() + self.prune_interval
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.refresh()
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + self.prune_interval
+                    self.prune()
+            except Exception as e:
+                # A locked or closing database must not end the poller; the next round retries
+                print(f"Book event poller error: {e}")
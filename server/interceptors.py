@@ -0,0 +1,207 @@
+import inspect
+import time
+
+import grpc
+
+from metrics import Counter, Gauge, Histogram, SIZE_BUCKETS
+from tracing import Trace, current_trace
+
+# grpc.aio contexts report the status code as its integer value
+STATUS_CODE_NAMES = {code.value[0]: code.name for code in grpc.StatusCode}
+STATUS_CODE_NAMES.update({code: code.name for code in grpc.StatusCode})
+# Streams that stay open until the client leaves, so their duration says nothing about speed
+LONG_LIVED_METHODS = {'watch_books'}
+
+class RpcMetrics:
+    """Per-method latency, in-flight, status code and message size metrics for the gRPC server.
+
+    With slow_rpc_seconds set, every RPC also carries a Trace of its SQL and serialization
+    time, which is printed when the RPC takes at least that long.
+    """
+
+    def __init__(self, registry, slow_rpc_seconds=0):
+        self.slow_rpc_seconds = slow_rpc_seconds
+        self.handled = registry.register(Counter(
+            'grpc_server_handled_total', 'RPCs completed on the server, by method and status code',
+            ('grpc_method', 'grpc_code')))
+        self.latency = registry.register(Histogram(
+            'grpc_server_handling_seconds', 'Time from receiving an RPC to finishing its response',
+            ('grpc_method',)))
+        self.in_flight = registry.register(Gauge(
+            'grpc_server_in_flight', 'RPCs currently being handled', ('grpc_method',)))
+        self.received_bytes = registry.register(Histogram(
+            'grpc_server_msg_received_bytes', 'Size of request messages',
+            ('grpc_method',), SIZE_BUCKETS))
+        self.sent_bytes = registry.register(Histogram(
+            'grpc_server_msg_sent_bytes', 'Size of serialized response messages',
+            ('grpc_method',), SIZE_BUCKETS))
+
+    def instrument(self, handler, method):
+        """Returns a copy of the method handler that records metrics around its behavior"""
+        labels = (method.rsplit('/', 1)[-1],)
+        traced = bool(self.slow_rpc_seconds) and labels[0] not in LONG_LIVED_METHODS
+        request_deserializer = handler.request_deserializer
+        response_serializer = handler.response_serializer
+
+        def deserialize(data):
+            self.received_bytes.observe(labels, len(data))
+            return request_deserializer(data) if request_deserializer else data
+
+        def serialize(response):
+            # Runs inside the behavior, while the RPC's trace is still current
+            data = response_serializer(response) if response_serializer else response
+            self.sent_bytes.observe(labels, len(data))
+            return data
+
+        kind = ('stream' if handler.request_streaming else 'unary') + '_' + \
+               ('stream' if handler.response_streaming else 'unary')
+        behavior = self._wrap(getattr(handler, kind), labels, serialize, traced)
+        # Responses leave the wrapper serialized, so gRPC must pass them through as is
+        return handler._replace(request_deserializer=deserialize, response_serializer=None, **{kind: behavior})
+
+    def _start(self, labels, traced):
+        self.in_flight.inc(labels)
+        if traced:
+            current_trace.set(Trace(labels[0]))
+        return time.perf_counter()
+
+    def _finish(self, labels, context, start, failed, traced):
+        elapsed = time.perf_counter() - start
+        self.latency.observe(labels, elapsed)
+        self.in_flight.dec(labels)
+        code = context.code()
+        if code is None:
+            code = grpc.StatusCode.UNKNOWN if failed else grpc.StatusCode.OK
+        self.handled.inc(labels + (STATUS_CODE_NAMES.get(code, str(code)),))
+
+        if traced:
+            trace = current_trace.get()
+            # Cleared rather than reset: a cancelled stream may be closed from another context
+            current_trace.set(None)
+            if trace is not None and elapsed >= self.slow_rpc_seconds:
+                print(trace.format(elapsed))
+
+    def _wrap(self, behavior, labels, serialize, traced):
+        if inspect.isasyncgenfunction(behavior):
+            async def wrapper(request, context):
+                start, failed = self._start(labels, traced), True
+                try:
+                    async for response in behavior(request, context):
+                        yield serialize(response)
+                    failed = False
+                finally:
+                    self._finish(labels, context, start, failed, traced)
+        elif inspect.iscoroutinefunction(behavior):
+            async def wrapper(request, context):
+                start, failed = self._start(labels, traced), True
+                try:
+                    response = serialize(await behavior(request, context))
+                    failed = False
+                    return response
+                finally:
+                    self._finish(labels, context, start, failed, traced)
+        elif inspect.isgeneratorfunction(behavior):
+            def wrapper(request, context):
+                start, failed = self._start(labels, traced), True
+                try:
+                    for response in behavior(request, context):
+                        yield serialize(response)
+                    failed = False
+                finally:
+                    self._finish(labels, context, start, failed, traced)
+        else:
+            def wrapper(request, context):
+                start, failed = self._start(labels, traced), True
+                try:
+                    response = serialize(behavior(request, context))
+                    failed = False
+                    return response
+                finally:
+                    self._finish(labels, context, start, failed, traced)
+        return wrapper
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """Records RpcMetrics for every RPC on a grpc.server; instrumented handlers are built once per method"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._handlers = {}
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = handler_call_details.method
+        cached = self._handlers.get(method)
+        if cached is None or cached[0] is not handler:
+            cached = self._handlers[method] = (handler, self.metrics.instrument(handler, method))
+        return cached[1]
+
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """MetricsInterceptor for grpc.aio servers"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._handlers = {}
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = handler_call_details.method
+        cached = self._handlers.get(method)
+        if cached is None or cached[0] is not handler:
+            cached = self._handlers[method] = (handler, self.metrics.instrument(handler, method))
+        return cached[1]
+
+
+class AsyncConcurrencyLimitInterceptor(grpc.aio.ServerInterceptor):
+    """Fails RPCs fast with RESOURCE_EXHAUSTED while limit of them are in progress.
+
+    grpc.aio.server's own maximum_concurrent_rpcs holds further calls back instead,
+    so they wait until their deadline; a single event loop runs every handler here,
+    so a plain counter is enough.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._handlers = {}
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = handler_call_details.method
+        cached = self._handlers.get(method)
+        if cached is None or cached[0] is not handler:
+            kind = ('stream' if handler.request_streaming else 'unary') + '_' + \
+                   ('stream' if handler.response_streaming else 'unary')
+            limited = handler._replace(**{kind: self._wrap(getattr(handler, kind))})
+            cached = self._handlers[method] = (handler, limited)
+        return cached[1]
+
+    async def _admit(self, context):
+        if self.active >= self.limit:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, f'More than {self.limit} concurrent RPCs')
+        self.active += 1
+
+    def _wrap(self, behavior):
+        if inspect.isasyncgenfunction(behavior):
+            async def wrapper(request, context):
+                await self._admit(context)
+                try:
+                    async for response in behavior(request, context):
+                        yield response
+                finally:
+                    self.active -= 1
+        else:
+            async def wrapper(request, context):
+                await self._admit(context)
+                try:
+                    return await behavior(request, context)
+                finally:
+                    self.active -= 1
+        return wrapper
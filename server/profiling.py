@@ -0,0 +1,54 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_MAX_SECONDS = 60
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler over every thread of the process.
+
+    Each sample walks the stack of every other thread via sys._current_frames(), so
+    nothing is instrumented and the running server pays only while a profile runs.
+    Results are collapsed stacks ("thread;outer;...;inner count" per line), the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def profile(self, seconds):
+        """Samples for the given number of seconds; raises ProfilerBusy if a profile is already running"""
+        seconds = min(max(seconds, 0), PROFILE_MAX_SECONDS)
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            return self._sample(seconds)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds):
+        own_thread = threading.get_ident()
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
@@ -1,10 +1,19 @@
 import grpc
+import asyncio
+import base64
+import binascii
+import contextvars
+import functools
+import inspect
 from concurrent import futures
 import sys
 import os
 import signal
 import sqlite3
+import time
+import traceback
 from dotenv import load_dotenv
+from google.protobuf import descriptor_pb2
 
 load_dotenv()
 
@@ -12,14 +21,49 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import books_pb2
 import books_pb2_grpc
+from cache import ResponseCache, SharedInvalidations
+from database import ConnectionPool
+from events import ChangeFeed
+from interceptors import AsyncConcurrencyLimitInterceptor, AsyncMetricsInterceptor, MetricsInterceptor, RpcMetrics
+from metrics import Registry, start_http_server
+from profiling import ProfilerBusy, SamplingProfiler
+from tracing import current_trace
 
 DB_PATH = os.getenv('DB_PATH', 'books.db')
+COMPRESSION_ALGORITHMS = {
+    'none': grpc.Compression.NoCompression,
+    'gzip': grpc.Compression.Gzip,
+    'deflate': grpc.Compression.Deflate,
+}
+BOOK_COLUMNS = ('id', 'title', 'author', 'year')
+INT32_MAX = 2 ** 31 - 1
+BATCH_MAX_IDS = int(os.getenv('BATCH_MAX_IDS', '1000'))
+# Stay well below SQLite's limit on host parameters per statement
+SQLITE_MAX_PARAMS = 500
+LIST_DEFAULT_PAGE_SIZE = int(os.getenv('LIST_DEFAULT_PAGE_SIZE', '100'))
+LIST_MAX_PAGE_SIZE = int(os.getenv('LIST_MAX_PAGE_SIZE', '1000'))
+SEARCH_DEFAULT_LIMIT = int(os.getenv('SEARCH_DEFAULT_LIMIT', '20'))
+SEARCH_MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', '100'))
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '10000'))
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', '500'))
+STREAM_MAX_CHUNK_SIZE = int(os.getenv('STREAM_MAX_CHUNK_SIZE', '10000'))
+WATCH_BATCH_SIZE = int(os.getenv('WATCH_BATCH_SIZE', '500'))
+# How often a sync watch_books stream checks whether its client is still there, in seconds
+WATCH_CHECK_INTERVAL = 1
+# A pre-forked worker that exits sooner than this after starting is taken as broken, in seconds
+WORKER_MIN_UPTIME = int(os.getenv('GRPC_WORKER_MIN_UPTIME', '5'))
+# Delay before restarting a worker that died, doubled for each crash in a row up to the maximum
+WORKER_RESTART_DELAY = 1
+WORKER_MAX_RESTART_DELAY = 60
 
 
 def init_db():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
 
+    # WAL is persistent in the database file and lets readers run alongside a writer
+    cursor.execute(f"PRAGMA journal_mode = {os.getenv('DB_JOURNAL_MODE', 'WAL')}")
+
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS books (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -29,6 +73,64 @@ def init_db():
     )
     ''')
 
+    # Indexes backing the list_books filters; id is appended so keyset pagination stays ordered
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_books_author ON books (author, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_books_year ON books (year, id)")
+
+    # Full-text index over title and author, kept in sync with books by triggers
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'")
+    fts_exists = cursor.fetchone() is not None
+
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title,
+        author,
+        content='books',
+        content_rowid='id',
+        prefix='2 3'
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE ON books BEGIN
+        INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    ''')
+
+    # Change log read by watch_books; versions come from AUTOINCREMENT, so they are never reused
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS book_events (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        type INTEGER NOT NULL,
+        book_id INTEGER NOT NULL
+    )
+    ''')
+    # Types are the BookEvent.Type values: 1 is ADDED, 2 is DELETED
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS book_events_insert AFTER INSERT ON books BEGIN
+        INSERT INTO book_events (type, book_id) VALUES (1, new.id);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS book_events_delete AFTER DELETE ON books BEGIN
+        INSERT INTO book_events (type, book_id) VALUES (2, old.id);
+    END
+    ''')
+
+    if not fts_exists:
+        # Index the rows of a database created before the search index existed
+        cursor.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+
     cursor.execute("SELECT COUNT(*) FROM books")
     count = cursor.fetchone()[0]
 
@@ -44,65 +146,357 @@ def init_db():
     conn.close()
 
 
+def encode_page_token(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+
+def decode_page_token(token):
+    """Returns the last seen book ID stored in a page token, or None if the token is malformed"""
+    try:
+        last_id = int(base64.urlsafe_b64decode(token.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    # Book IDs are int32; anything else could not have come from a page and may not even fit SQLite
+    if not 1 <= last_id <= INT32_MAX:
+        return None
+    return last_id
+
+
+def read_mask_columns(read_mask):
+    """Returns the book columns named by a read mask (all of them when it is empty), or None if it names others"""
+    if not read_mask.paths:
+        return BOOK_COLUMNS
+    if not set(read_mask.paths) <= set(BOOK_COLUMNS):
+        return None
+    return tuple(column for column in BOOK_COLUMNS if column in read_mask.paths)
+
+
+def build_search_query(text):
+    """Turns free text into an FTS5 query that matches every word, each as a quoted prefix"""
+    terms = []
+    for word in text.split():
+        if not any(char.isalnum() for char in word):
+            continue
+        terms.append('"' + word.replace('"', '""') + '"*')
+    return " ".join(terms)
+
+
+def serialize_response(response):
+    """Serializes a response message; handlers may also return already serialized bytes"""
+    if isinstance(response, bytes):
+        return response
+    trace = current_trace.get()
+    if trace is None:
+        return response.SerializeToString()
+    with trace.span('serialize', type(response).__name__):
+        return response.SerializeToString()
+
+
+def skip_expired(response_class):
+    """Decorates a unary handler so that an RPC whose deadline passed while it waited for
+    a thread is answered with DEADLINE_EXCEEDED without doing its work"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(self, request, context):
+            remaining = context.time_remaining()
+            if remaining is not None and remaining <= 0:
+                context.set_code(grpc.StatusCode.DEADLINE_EXCEEDED)
+                context.set_details("Deadline expired before the request was handled")
+                return response_class()
+            return handler(self, request, context)
+        return wrapper
+    return decorator
+
+
+def parse_compression(name):
+    """Maps a compression name from the environment to grpc.Compression; empty means not set"""
+    if not name:
+        return None
+    try:
+        return COMPRESSION_ALGORITHMS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown compression {name!r}, expected one of: {', '.join(COMPRESSION_ALGORITHMS)}")
+
+
+def apply_compression_policy(behavior, compression, min_bytes):
+    """Wraps a handler so that it serializes its own responses, sets a per-method compression
+    override and sends every response message smaller than min_bytes uncompressed"""
+
+    def prepare(response, context):
+        data = serialize_response(response)
+        if len(data) < min_bytes:
+            context.disable_next_message_compression()
+        return data
+
+    if inspect.isasyncgenfunction(behavior):
+        async def handler(request, context):
+            if compression is not None:
+                context.set_compression(compression)
+            async for response in behavior(request, context):
+                yield prepare(response, context)
+    elif inspect.iscoroutinefunction(behavior):
+        async def handler(request, context):
+            if compression is not None:
+                context.set_compression(compression)
+            return prepare(await behavior(request, context), context)
+    elif inspect.isgeneratorfunction(behavior):
+        def handler(request, context):
+            if compression is not None:
+                context.set_compression(compression)
+            for response in behavior(request, context):
+                yield prepare(response, context)
+    else:
+        def handler(request, context):
+            if compression is not None:
+                context.set_compression(compression)
+            return prepare(behavior(request, context), context)
+
+    return handler
+
+
+def add_book_service_to_server(servicer, server, method_compression=None, compression_min_bytes=0):
+    """Registers the servicer like books_pb2_grpc.add_BookServiceServicer_to_server, but with
+    a response serializer that passes pre-serialized responses through untouched.
+
+    method_compression maps method names to a grpc.Compression that overrides the server
+    default for that method; responses below compression_min_bytes are never compressed.
+    """
+    method_compression = method_compression or {}
+    service = books_pb2.DESCRIPTOR.services_by_name['BookService']
+    service_proto = descriptor_pb2.ServiceDescriptorProto()
+    service.CopyToProto(service_proto)
+
+    handler_factories = {
+        (False, False): grpc.unary_unary_rpc_method_handler,
+        (False, True): grpc.unary_stream_rpc_method_handler,
+        (True, False): grpc.stream_unary_rpc_method_handler,
+        (True, True): grpc.stream_stream_rpc_method_handler,
+    }
+
+    rpc_method_handlers = {}
+    for method in service_proto.method:
+        handler_factory = handler_factories[(method.client_streaming, method.server_streaming)]
+        request_class = getattr(books_pb2, service.methods_by_name[method.name].input_type.name)
+        behavior = getattr(servicer, method.name)
+        compression = method_compression.get(method.name)
+        if compression is not None or compression_min_bytes > 0:
+            behavior = apply_compression_policy(behavior, compression, compression_min_bytes)
+        rpc_method_handlers[method.name] = handler_factory(
+            behavior,
+            request_deserializer=request_class.FromString,
+            response_serializer=serialize_response
+        )
+
+    server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(service.full_name, rpc_method_handlers),))
+
+
+def add_id_range(id_ranges, first_id, last_id):
+    """Appends an imported ID range, merging it into the previous one when they are adjacent"""
+    if id_ranges and id_ranges[-1].last_id + 1 == first_id:
+        id_ranges[-1].last_id = last_id
+    else:
+        id_ranges.append(books_pb2.IdRange(first_id=first_id, last_id=last_id))
+
+
 class BookServiceServicer(books_pb2_grpc.BookServiceServicer):
 
-    def get_book(self, request, context):
-        """Returns a book by ID"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+    def __init__(self, pool, cache, events):
+        self.pool = pool
+        self.cache = cache
+        self.events = events
 
-        cursor.execute("SELECT id, title, author, year FROM books WHERE id = ?", (request.id,))
-        book_data = cursor.fetchone()
+    def get_book(self, request, context):
+        """Returns a book by ID, served from the cache of serialized responses when possible"""
+        if not request.read_mask.paths:
+            cached = self.cache.get(request.id)
+            if cached is not None:
+                return cached
+        return self.load_book(request, context)
+
+    @skip_expired(books_pb2.BookResponse)
+    def load_book(self, request, context):
+        """Reads the requested columns of a book; full responses are cached serialized"""
+        columns = read_mask_columns(request.read_mask)
+        if columns is None:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(f"read_mask may only contain: {', '.join(BOOK_COLUMNS)}")
+            return books_pb2.BookResponse()
 
-        conn.close()
+        generation = self.cache.generation
+        with self.pool.connection() as conn:
+            cursor = conn.execute(f"SELECT {', '.join(columns)} FROM books WHERE id = ?", (request.id,))
+            book_data = cursor.fetchone()
 
         if book_data:
-            book = books_pb2.Book(
-                id=book_data[0],
-                title=book_data[1],
-                author=book_data[2],
-                year=book_data[3]
-            )
-            return books_pb2.BookResponse(book=book)
+            book = books_pb2.Book(**dict(zip(columns, book_data)))
+            response = serialize_response(books_pb2.BookResponse(book=book))
+            if columns == BOOK_COLUMNS:
+                self.cache.set(request.id, response, generation)
+            return response
         else:
             context.set_code(grpc.StatusCode.NOT_FOUND)
             context.set_details(f"Book with ID {request.id} not found")
             return books_pb2.BookResponse()
 
+    @skip_expired(books_pb2.BatchGetBooksResponse)
+    def batch_get_books(self, request, context):
+        """Returns several books by ID, from the get_book response cache where possible and
+        with a single query per chunk of the remaining IDs, whose rows are cached in turn"""
+        ids = list(dict.fromkeys(request.ids))
+        if len(ids) > BATCH_MAX_IDS:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(f"At most {BATCH_MAX_IDS} IDs can be requested at once")
+            return books_pb2.BatchGetBooksResponse()
+
+        found = {}
+        for book_id in ids:
+            cached = self.cache.get(book_id)
+            if cached is not None:
+                found[book_id] = books_pb2.BookResponse.FromString(cached).book
+
+        uncached_ids = [book_id for book_id in ids if book_id not in found]
+        if uncached_ids:
+            generation = self.cache.generation
+            with self.pool.connection() as conn:
+                for start in range(0, len(uncached_ids), SQLITE_MAX_PARAMS):
+                    chunk = uncached_ids[start:start + SQLITE_MAX_PARAMS]
+                    placeholders = ", ".join("?" * len(chunk))
+                    cursor = conn.execute(
+                        f"SELECT id, title, author, year FROM books WHERE id IN ({placeholders})", chunk)
+                    for book_data in cursor.fetchall():
+                        found[book_data[0]] = books_pb2.Book(
+                            id=book_data[0],
+                            title=book_data[1],
+                            author=book_data[2],
+                            year=book_data[3]
+                        )
+
+            for book_id in uncached_ids:
+                book = found.get(book_id)
+                if book is not None:
+                    self.cache.set(book_id, serialize_response(books_pb2.BookResponse(book=book)), generation)
+
+        books = []
+        missing_ids = []
+        for book_id in ids:
+            book = found.get(book_id)
+            if book is None:
+                missing_ids.append(book_id)
+            else:
+                books.append(book)
+
+        return books_pb2.BatchGetBooksResponse(books=books, missing_ids=missing_ids)
+
+    @skip_expired(books_pb2.ListBooksResponse)
     def list_books(self, request, context):
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        """Returns one page of books ordered by ID, using the page token as a keyset cursor"""
+        page_size = min(request.page_size or LIST_DEFAULT_PAGE_SIZE, LIST_MAX_PAGE_SIZE)
+        if page_size < 0:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details("page_size must not be negative")
+            return books_pb2.ListBooksResponse()
+
+        columns = read_mask_columns(request.read_mask)
+        if columns is None:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(f"read_mask may only contain: {', '.join(BOOK_COLUMNS)}")
+            return books_pb2.ListBooksResponse()
+        # The ID is always read because the page token is built from it
+        selected_columns = ('id',) + tuple(column for column in columns if column != 'id')
+
+        conditions = []
+        params = []
+
+        if request.page_token:
+            last_id = decode_page_token(request.page_token)
+            if last_id is None:
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details("Invalid page_token")
+                return books_pb2.ListBooksResponse()
+            conditions.append("id > ?")
+            params.append(last_id)
+
+        if request.author:
+            conditions.append("author = ?")
+            params.append(request.author)
+
+        if request.HasField("min_year"):
+            conditions.append("year >= ?")
+            params.append(request.min_year)
+
+        if request.HasField("max_year"):
+            conditions.append("year <= ?")
+            params.append(request.max_year)
+
+        query = f"SELECT {', '.join(selected_columns)} FROM books"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # One extra row tells us whether another page exists
+        query += " ORDER BY id LIMIT ?"
+        params.append(page_size + 1)
+
+        with self.pool.connection() as conn:
+            books_data = conn.execute(query, params).fetchall()
+
+        next_page_token = ""
+        if len(books_data) > page_size:
+            books_data = books_data[:page_size]
+            next_page_token = encode_page_token(books_data[-1][0])
 
-        cursor.execute("SELECT id, title, author, year FROM books")
-        books_data = cursor.fetchall()
+        books = []
+        for book_data in books_data:
+            book = books_pb2.Book(**{
+                column: value for column, value in zip(selected_columns, book_data) if column in columns
+            })
+            books.append(book)
 
-        conn.close()
+        return books_pb2.ListBooksResponse(books=books, next_page_token=next_page_token)
+
+    @skip_expired(books_pb2.SearchBooksResponse)
+    def search_books(self, request, context):
+        """Returns books whose title or author match every query word, best match first"""
+        limit = min(request.limit or SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT)
+        query = build_search_query(request.query)
+        if not query or limit < 0:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details("query must contain at least one word and limit must not be negative")
+            return books_pb2.SearchBooksResponse()
+
+        with self.pool.connection() as conn:
+            # Title matches weigh twice as much as author matches
+            books_data = conn.execute(
+                """
+                SELECT books.id, books.title, books.author, books.year
+                FROM books_fts JOIN books ON books.id = books_fts.rowid
+                WHERE books_fts MATCH ?
+                ORDER BY bm25(books_fts, 2.0, 1.0)
+                LIMIT ?
+                """,
+                (query, limit)
+            ).fetchall()
 
         books = []
         for book_data in books_data:
-            book = books_pb2.Book(
+            books.append(books_pb2.Book(
                 id=book_data[0],
                 title=book_data[1],
                 author=book_data[2],
                 year=book_data[3]
-            )
-            books.append(book)
+            ))
 
-        return books_pb2.ListBooksResponse(books=books)
+        return books_pb2.SearchBooksResponse(books=books)
 
+    @skip_expired(books_pb2.BookResponse)
     def add_book(self, request, context):
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "INSERT INTO books (title, author, year) VALUES (?, ?, ?)",
-            (request.title, request.author, request.year)
-        )
-
-        book_id = cursor.lastrowid
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO books (title, author, year) VALUES (?, ?, ?)",
+                (request.title, request.author, request.year)
+            )
+            book_id = cursor.lastrowid
 
-        conn.commit()
-        conn.close()
+        self.cache.invalidate(book_id)
+        self.events.refresh()
 
         book = books_pb2.Book(
             id=book_id,
@@ -113,56 +507,473 @@ class BookServiceServicer(books_pb2_grpc.BookServiceServicer):
 
         return books_pb2.BookResponse(book=book)
 
+    def import_books(self, request_iterator, context):
+        """Inserts a stream of books, one transaction and executemany call per batch"""
+        id_ranges = []
+        imported_count = 0
+
+        rows = []
+        for request in request_iterator:
+            rows.append((request.title, request.author, request.year))
+            if len(rows) >= IMPORT_BATCH_SIZE:
+                add_id_range(id_ranges, *self.insert_books(rows))
+                imported_count += len(rows)
+                rows = []
+
+        if rows:
+            add_id_range(id_ranges, *self.insert_books(rows))
+            imported_count += len(rows)
+
+        return books_pb2.ImportBooksResponse(imported_count=imported_count, id_ranges=id_ranges)
+
+    def insert_books(self, rows):
+        """Inserts (title, author, year) rows in one transaction and returns the first and last assigned IDs"""
+        # The transaction holds the write lock for the whole batch, so its AUTOINCREMENT IDs are contiguous
+        with self.pool.transaction() as conn:
+            conn.executemany("INSERT INTO books (title, author, year) VALUES (?, ?, ?)", rows)
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+        self.events.refresh()
+        return last_id - len(rows) + 1, last_id
+
+    @skip_expired(books_pb2.DeleteBookResponse)
     def delete_book(self, request, context):
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        with self.pool.connection() as conn:
+            cursor = conn.execute("DELETE FROM books WHERE id = ?", (request.id,))
+            deleted = cursor.rowcount > 0
 
-        cursor.execute("SELECT id FROM books WHERE id = ?", (request.id,))
-        book = cursor.fetchone()
+        self.cache.invalidate(request.id)
+        if deleted:
+            self.events.refresh()
 
-        if not book:
-            conn.close()
+        if not deleted:
             context.set_code(grpc.StatusCode.NOT_FOUND)
             context.set_details(f"Book with ID {request.id} not found")
             return books_pb2.DeleteBookResponse(success=False, message=f"Book with ID {request.id} not found")
 
-        cursor.execute("DELETE FROM books WHERE id = ?", (request.id,))
-        conn.commit()
-        conn.close()
-
         return books_pb2.DeleteBookResponse(success=True, message=f"Book with ID {request.id} deleted successfully")
 
+    def stream_books(self, request, context):
+        """Streams all books, reading rows from the database in keyset-paginated chunks"""
+        chunk_size = min(request.chunk_size or STREAM_CHUNK_SIZE, STREAM_MAX_CHUNK_SIZE)
+        last_id = 0
+
+        while True:
+            books_data = self.read_books_after(last_id, chunk_size)
+            if not books_data:
+                break
+            last_id = books_data[-1][0]
+
+            for book_data in books_data:
+                yield books_pb2.Book(
+                    id=book_data[0],
+                    title=book_data[1],
+                    author=book_data[2],
+                    year=book_data[3]
+                )
+
+    def watch_books(self, request, context):
+        """Streams the events after request.from_version, then each new one as it is written"""
+        if not self.events.add_watcher():
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            context.set_details(f"At most {self.events.max_watchers} watch_books streams can be open")
+            return
+
+        try:
+            version = request.from_version
+            while not self.events.closed:
+                events = self.events.read(version, WATCH_BATCH_SIZE)
+                if events:
+                    yield from events
+                    version = events[-1].version
+                    continue
+                # Each stream holds a worker thread, so it wakes up now and then to notice a client that left
+                while self.events.version <= version and not self.events.closed:
+                    if not context.is_active():
+                        return
+                    self.events.wait(version, WATCH_CHECK_INTERVAL)
+        finally:
+            self.events.remove_watcher()
+
+    def read_books_after(self, last_id, limit):
+        """Returns up to limit book rows with an ID greater than last_id"""
+        # The connection goes back to the pool between chunks, so a slow reader never pins one
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT id, title, author, year FROM books WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, limit)
+            ).fetchall()
+
+
+class AsyncBookServiceServicer(books_pb2_grpc.BookServiceServicer):
+    """Serves BookServiceServicer on grpc.aio, running all SQLite work on a bounded executor"""
+
+    def __init__(self, servicer, executor):
+        self.servicer = servicer
+        self.executor = executor
+
+    async def _run(self, fn, *args):
+        # Run in a copy of the RPC's context so the executor thread sees its trace
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, context.run, fn, *args)
+
+    async def get_book(self, request, context):
+        # Cache hits are answered on the event loop without a trip through the executor
+        if not request.read_mask.paths:
+            cached = self.servicer.cache.get(request.id)
+            if cached is not None:
+                return cached
+        return await self._run(self.servicer.load_book, request, context)
+
+    async def batch_get_books(self, request, context):
+        return await self._run(self.servicer.batch_get_books, request, context)
+
+    async def list_books(self, request, context):
+        return await self._run(self.servicer.list_books, request, context)
+
+    async def search_books(self, request, context):
+        return await self._run(self.servicer.search_books, request, context)
+
+    async def add_book(self, request, context):
+        return await self._run(self.servicer.add_book, request, context)
+
+    async def import_books(self, request_iterator, context):
+        id_ranges = []
+        imported_count = 0
+
+        # Only the inserts go to the executor; waiting for the next batch never holds a thread or the write lock
+        rows = []
+        async for request in request_iterator:
+            rows.append((request.title, request.author, request.year))
+            if len(rows) >= IMPORT_BATCH_SIZE:
+                add_id_range(id_ranges, *await self._run(self.servicer.insert_books, rows))
+                imported_count += len(rows)
+                rows = []
+
+        if rows:
+            add_id_range(id_ranges, *await self._run(self.servicer.insert_books, rows))
+            imported_count += len(rows)
+
+        return books_pb2.ImportBooksResponse(imported_count=imported_count, id_ranges=id_ranges)
+
+    async def delete_book(self, request, context):
+        return await self._run(self.servicer.delete_book, request, context)
+
+    async def stream_books(self, request, context):
+        chunk_size = min(request.chunk_size or STREAM_CHUNK_SIZE, STREAM_MAX_CHUNK_SIZE)
+        last_id = 0
+
+        while True:
+            books_data = await self._run(self.servicer.read_books_after, last_id, chunk_size)
+            if not books_data:
+                break
+            last_id = books_data[-1][0]
+
+            for book_data in books_data:
+                yield books_pb2.Book(
+                    id=book_data[0],
+                    title=book_data[1],
+                    author=book_data[2],
+                    year=book_data[3]
+                )
+
+    async def watch_books(self, request, context):
+        events = self.servicer.events
+        if not events.add_watcher():
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            context.set_details(f"At most {events.max_watchers} watch_books streams can be open")
+            return
+
+        # Waiting for new events holds no executor thread; a client that leaves cancels the wait
+        try:
+            version = request.from_version
+            while not events.closed:
+                batch = await self._run(events.read, version, WATCH_BATCH_SIZE)
+                if batch:
+                    for event in batch:
+                        yield event
+                    version = batch[-1].version
+                    continue
+                while events.version <= version and not events.closed:
+                    await events.wait_async(version)
+        finally:
+            events.remove_watcher()
+
+
+def cache_collector(cache):
+    """Collector exporting the book cache counters at scrape time"""
+    def collect():
+        stats = cache.stats()
+        return [
+            ('book_cache_entries', 'gauge', 'Serialized book responses in the cache', [({}, stats['size'])]),
+            ('book_cache_hits_total', 'counter', 'Book lookups by ID served from the cache', [({}, stats['hits'])]),
+            ('book_cache_misses_total', 'counter', 'Book lookups by ID that missed the cache', [({}, stats['misses'])]),
+        ]
+    return collect
+
+
+def profile_route(profiler):
+    """GET /debug/profile?seconds=N on the metrics port, returning collapsed stacks"""
+    def route(query):
+        try:
+            seconds = float(query.get('seconds', ['10'])[0])
+        except ValueError:
+            return 400, 'text/plain', 'seconds must be a number\n'
+        try:
+            return 200, 'text/plain', profiler.profile(seconds)
+        except ProfilerBusy as e:
+            return 409, 'text/plain', f'{e}\n'
+    return route
+
+
+async def serve_aio(servicer, pool, port, options, max_workers, shutdown_timeout, compression, metrics,
+                    max_concurrent_rpcs=None, worker=None):
+    """Runs the service on a grpc.aio server; SQLite calls go through an executor bounded by max_workers"""
+    executor = futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+    interceptors = [AsyncMetricsInterceptor(metrics)]
+    if max_concurrent_rpcs:
+        # After the metrics interceptor, so that rejected RPCs are counted too
+        interceptors.append(AsyncConcurrencyLimitInterceptor(max_concurrent_rpcs))
+    server = grpc.aio.server(
+        options=options,
+        compression=compression['default'],
+        interceptors=interceptors
+    )
+
+    add_book_service_to_server(AsyncBookServiceServicer(servicer, executor), server,
+                               compression['methods'], compression['min_bytes'])
+
+    server.add_insecure_port(f'[::]:{port}')
+
+    await server.start()
+    print(f"Async server started on port {port}" + (f" (worker {worker}, pid {os.getpid()})" if worker is not None else ""))
+
+    stop_requested = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stop_requested.set)
+    loop.add_signal_handler(signal.SIGINT, stop_requested.set)
+
+    await stop_requested.wait()
+
+    print("Shutting down server...")
+    servicer.events.close()
+    await server.stop(shutdown_timeout)
+    executor.shutdown()
+    pool.close()
+    print(f"Book cache stats: {servicer.cache.stats()}")
+    print("Server stopped successfully")
+
 
 def serve():
+    # Schema and sample data are set up once, before any worker is forked
     init_db()
 
+    processes = int(os.getenv('GRPC_PROCESSES', '1'))  # more than 1 pre-forks workers sharing the port
+    if processes > 1:
+        serve_prefork(processes)
+    else:
+        run_server()
+
+
+def serve_prefork(processes):
+    """Forks worker processes that each run their own server on the same port through
+    SO_REUSEPORT, so the kernel spreads connections over them and each gets its own GIL.
+
+    SIGTERM and SIGINT are forwarded to the workers. A worker that dies on its own is
+    restarted after a delay that grows while it keeps crashing, unless it exits within
+    WORKER_MIN_UPTIME of starting, e.g. because the port is taken: then every worker is
+    stopped and the parent exits with code 1. The parent never touches gRPC, which is
+    not fork-safe once started.
+    """
+    invalidations = SharedInvalidations()
+    workers = {}
+    started = {}
+    crashes = {}
+    restarts = {}
+    stopping = False
+    failed = False
+
+    def start_worker(index):
+        started[index] = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                run_server(index, invalidations)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        workers[pid] = index
+
+    def stop_workers():
+        nonlocal stopping
+        stopping = True
+        restarts.clear()
+        print(f"Stopping {len(workers)} workers...")
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def handle_shutdown(sign, frame):
+        stop_workers()
+
+    signal.signal(signal.SIGTERM, handle_shutdown)
+    signal.signal(signal.SIGINT, handle_shutdown)
+
+    for index in range(processes):
+        start_worker(index)
+    print(f"Started {processes} worker processes")
+
+    while workers or restarts:
+        now = time.monotonic()
+        for index, restart_at in list(restarts.items()):
+            if restart_at <= now:
+                del restarts[index]
+                start_worker(index)
+        try:
+            if restarts:
+                # Wake up for the next pending restart while still reaping workers that exit
+                time.sleep(min(max(min(restarts.values()) - now, 0), 0.5))
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    continue
+            else:
+                pid, status = os.wait()
+        except ChildProcessError:
+            if restarts:
+                continue
+            break
+        index = workers.pop(pid, None)
+        if index is None or stopping:
+            continue
+
+        code = os.waitstatus_to_exitcode(status)
+        uptime = time.monotonic() - started[index]
+        if uptime < WORKER_MIN_UPTIME:
+            print(f"Worker {index} (pid {pid}) exited with code {code} after {uptime:.1f}s, giving up")
+            failed = True
+            stop_workers()
+            continue
+
+        # Crashes in a row lengthen the delay; a worker that stayed up for a while starts over
+        crashes[index] = crashes.get(index, 0) + 1 if uptime < WORKER_MAX_RESTART_DELAY * 2 else 1
+        delay = min(WORKER_RESTART_DELAY * 2 ** (crashes[index] - 1), WORKER_MAX_RESTART_DELAY)
+        print(f"Worker {index} (pid {pid}) exited with code {code}, restarting in {delay}s")
+        restarts[index] = time.monotonic() + delay
+
+    print("All workers stopped")
+    if failed:
+        sys.exit(1)
+
+
+def run_server(worker=None, invalidations=None):
+    """Runs one server until SIGTERM or SIGINT; worker is the index of a pre-forked worker process"""
     port = int(os.getenv('GRPC_PORT', '50051'))
+    server_mode = os.getenv('GRPC_SERVER_MODE', 'thread')  # thread or aio
     max_workers = int(os.getenv('GRPC_MAX_WORKERS', '10'))
+    # RPCs in progress or queued for a thread; beyond it new ones fail fast with RESOURCE_EXHAUSTED, 0 disables
+    max_concurrent_rpcs = int(os.getenv('GRPC_MAX_CONCURRENT_RPCS', str(max_workers * 10))) or None
     max_message_size = int(os.getenv('GRPC_MAX_MESSAGE_SIZE', '50')) * 1024 * 1024  # in MB
     keepalive_time = int(os.getenv('GRPC_KEEPALIVE_TIME', '60000'))  # in ms
     keepalive_timeout = int(os.getenv('GRPC_KEEPALIVE_TIMEOUT', '20000'))  # in ms
     shutdown_timeout = int(os.getenv('GRPC_SHUTDOWN_TIMEOUT', '30'))  # in seconds
+    metrics_port = int(os.getenv('GRPC_METRICS_PORT', '9464'))  # Prometheus /metrics, 0 disables it
+    if metrics_port and worker is not None:
+        metrics_port += worker  # one endpoint per worker, each scraped on its own
+    profiling = os.getenv('GRPC_PROFILING', 'false').lower() == 'true'  # /debug/profile on the metrics port
+    slow_rpc_ms = float(os.getenv('GRPC_SLOW_RPC_MS', '500'))  # log SQL and serialization time of slower RPCs, 0 disables
+    compression = {
+        'default': parse_compression(os.getenv('GRPC_COMPRESSION', 'none')),
+        # Per-method override for the large responses; unset means the server default. stream_books
+        # has none: it sends one small Book per message, which min_bytes always leaves uncompressed
+        'methods': {
+            'list_books': parse_compression(os.getenv('GRPC_LIST_COMPRESSION')),
+        },
+        'min_bytes': int(os.getenv('GRPC_COMPRESSION_MIN_BYTES', '1024')),  # smaller responses are sent as is
+    }
+
+    pool = ConnectionPool(
+        DB_PATH,
+        size=int(os.getenv('DB_POOL_SIZE', str(max_workers))),
+        journal_mode=os.getenv('DB_JOURNAL_MODE', 'WAL'),
+        synchronous=os.getenv('DB_SYNCHRONOUS', 'NORMAL'),
+        cache_size=int(os.getenv('DB_CACHE_SIZE', '-16000')),  # negative values are in KiB
+        mmap_size=int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024))),  # in bytes
+        busy_timeout=int(os.getenv('DB_BUSY_TIMEOUT', '5000')),  # in ms
+        cached_statements=int(os.getenv('DB_CACHED_STATEMENTS', '256'))
+    )
+
+    options = [
+        ('grpc.max_send_message_length', max_message_size),
+        ('grpc.max_receive_message_length', max_message_size),
+        ('grpc.keepalive_time_ms', keepalive_time),
+        ('grpc.keepalive_timeout_ms', keepalive_timeout),
+    ]
+    if worker is not None:
+        options.append(('grpc.so_reuseport', 1))
+
+    cache = ResponseCache(
+        maxsize=int(os.getenv('BOOK_CACHE_SIZE', '10000')),  # cached get_book responses, 0 disables
+        shared=invalidations
+    )
+
+    events = ChangeFeed(
+        pool,
+        # In thread mode each stream holds a worker thread; in aio mode it holds none, so there is no limit by default
+        max_watchers=int(os.getenv('WATCH_MAX_STREAMS', '4' if server_mode == 'thread' else '0')),  # 0 disables
+        poll_interval=float(os.getenv('WATCH_POLL_INTERVAL', '0.25')),  # in seconds, for writes by other processes
+        retention=int(os.getenv('BOOK_EVENTS_RETENTION', '100000'))  # newest events kept for resuming watchers
+    )
+    events.start()
+
+    servicer = BookServiceServicer(pool, cache, events)
+
+    registry = Registry()
+    metrics = RpcMetrics(registry, slow_rpc_seconds=slow_rpc_ms / 1000)
+    registry.add_collector(cache_collector(cache))
+    routes = {'/debug/profile': profile_route(SamplingProfiler())} if profiling else {}
+    if metrics_port:
+        try:
+            start_http_server(registry, metrics_port, routes)
+            print(f"Metrics available on port {metrics_port}" + (", profiling at /debug/profile" if profiling else ""))
+        except OSError as e:
+            print(f"Metrics endpoint disabled, could not bind port {metrics_port}: {e}")
+
+    if server_mode == 'aio':
+        asyncio.run(serve_aio(servicer, pool, port, options, max_workers, shutdown_timeout, compression, metrics,
+                              max_concurrent_rpcs, worker))
+        return
+    if server_mode != 'thread':
+        raise ValueError(f"Unknown GRPC_SERVER_MODE: {server_mode}")
 
     server = grpc.server(
         futures.ThreadPoolExecutor(max_workers=max_workers),
-        options=[
-            ('grpc.max_send_message_length', max_message_size),
-            ('grpc.max_receive_message_length', max_message_size),
-            ('grpc.keepalive_time_ms', keepalive_time),
-            ('grpc.keepalive_timeout_ms', keepalive_timeout),
-        ]
+        options=options,
+        maximum_concurrent_rpcs=max_concurrent_rpcs,
+        compression=compression['default'],
+        interceptors=[MetricsInterceptor(metrics)]
     )
 
-    books_pb2_grpc.add_BookServiceServicer_to_server(BookServiceServicer(), server)
+    add_book_service_to_server(servicer, server, compression['methods'], compression['min_bytes'])
 
     server.add_insecure_port(f'[::]:{port}')
 
     server.start()
-    print(f"Server started on port {port}")
+    print(f"Server started on port {port}" + (f" (worker {worker}, pid {os.getpid()})" if worker is not None else ""))
 
     def handle_shutdown(sign, frame):
         print("Shutting down server...")
-        stopped = server.stop(shutdown_timeout)
+        events.close()
+        stopped = server.stop(shutdown_timeout).wait()
+        pool.close()
+        print(f"Book cache stats: {cache.stats()}")
         if stopped:
             print("Server stopped successfully")
         else:
@@ -0,0 +1,45 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Trace of the RPC being handled; only set while the slow RPC log is enabled
+current_trace = ContextVar('current_trace', default=None)
+
+
+class Trace:
+    """Time spent in SQL statements and serialization during one RPC.
+
+    Spans are aggregated by kind and detail (the SQL text or message type), so a
+    long stream costs one entry per distinct statement rather than one per call.
+    """
+
+    def __init__(self, method):
+        self.method = method
+        self.spans = {}
+
+    def add(self, kind, detail, seconds, calls=1):
+        span = self.spans.get((kind, detail))
+        if span is None:
+            span = self.spans[(kind, detail)] = [0, 0.0]
+        span[0] += calls
+        span[1] += seconds
+
+    @contextmanager
+    def span(self, kind, detail):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(kind, detail, time.perf_counter() - start)
+
+    def format(self, seconds, limit=10):
+        """Summary line for the slow RPC log, followed by the most expensive spans"""
+        totals = {}
+        for (kind, _), (_, spent) in self.spans.items():
+            totals[kind] = totals.get(kind, 0.0) + spent
+        summary = ', '.join(f'{kind} {spent * 1000:.1f} ms' for kind, spent in totals.items()) or 'no spans'
+        lines = [f"Slow RPC {self.method} took {seconds * 1000:.1f} ms ({summary})"]
+        ranked = sorted(self.spans.items(), key=lambda item: item[1][1], reverse=True)
+        for (kind, detail), (calls, spent) in ranked[:limit]:
+            lines.append(f"  {spent * 1000:9.2f} ms  {calls:>6}x  {kind:<9} {' '.join(detail.split())[:200]}")
+        return '\n'.join(lines)